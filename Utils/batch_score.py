@@ -0,0 +1,170 @@
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from Utils.model_registry import available_models, discover_models
+from Utils.preprocessing import (SchemaError, RejectedRows, NUMERIC_FEATURES, CATEGORY_LEVELS, TARGET_COLUMN,
+                                 resolve_columns, prepare_and_validate)
+from Utils.scoring import CHUNK_SIZE, score_parallel, read_csv_chunks
+
+# invalid rows kept in memory for the optional rejected rows file
+MAX_REJECTED_ROWS = 100_000
+
+# columns added by the scoring, with their parquet types
+PREDICTION_TYPES = {"PredictionTime": pa.date32(), "Prediction": pa.string(), "PredictionProbability": pa.float64()}
+
+
+class UnknownModelError(ValueError):
+    """ Raised when a model name matches no model of the registry """
+
+
+def resolve_model_name(name):
+    """ Returns the registry display name for a display name or artifact file name such as "knn" """
+    if name in available_models():
+        return name
+    for display_name, path in discover_models().items():
+        if name == os.path.splitext(os.path.basename(path))[0]:
+            return display_name
+    raise UnknownModelError(f"Unknown model '{name}'. Available models: {', '.join(available_models())}")
+
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in (".parquet", ".pq")
+
+
+def read_columns(path):
+    """ Returns the column names of a csv or parquet file without reading its rows """
+    if _is_parquet(path):
+        return pq.read_schema(path).names
+    return pd.read_csv(path, nrows=0).columns
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """ Yields a csv or parquet file chunk_size rows at a time """
+    if _is_parquet(path):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from read_csv_chunks(path, chunk_size)
+
+
+def output_schema(input_path):
+    """ This function builds the schema of the scored file from the input columns, before any row is read
+    features get the types the preprocessing gives them, other parquet columns keep their type
+    and other csv columns, whose type could change from chunk to chunk, are written as text
+    returns a pyarrow schema, the input columns (renamed, without churn) then PREDICTION_TYPES
+    """
+    columns = read_columns(input_path)
+    rename = resolve_columns(columns)
+    input_schema = pq.read_schema(input_path) if _is_parquet(input_path) else None
+    fields = []
+    for column in columns:
+        name = rename.get(column, column)
+        if name == TARGET_COLUMN:
+            continue
+        if name in NUMERIC_FEATURES:
+            field_type = pa.float64()
+        elif name in CATEGORY_LEVELS:
+            field_type = pa.string()
+        elif input_schema is not None:
+            field_type = input_schema.field(column).type
+        else:
+            field_type = pa.string()
+        fields.append(pa.field(name, field_type))
+    return pa.schema(fields + [pa.field(name, field_type) for name, field_type in PREDICTION_TYPES.items()])
+
+
+def write_chunks(scored_chunks, path, schema):
+    """ This function streams scored chunks into a csv or parquet file
+    schema: pyarrow schema of the output (see output_schema), every parquet chunk is cast to it
+    the file is written next to path and moved in place at the end, so a failed run leaves no partial output;
+    without any row the output still holds the columns (csv header or parquet schema)
+    returns the number of rows written
+    """
+    temporary_path = f"{path}.tmp"
+    row_count = 0
+    try:
+        with open(temporary_path, "wb") as output:
+            if _is_parquet(path):
+                with pq.ParquetWriter(output, schema) as writer:
+                    for chunk in scored_chunks:
+                        writer.write_table(pa.Table.from_pandas(chunk, preserve_index=False).cast(schema))
+                        row_count += len(chunk)
+            else:
+                header = True
+                for chunk in scored_chunks:
+                    # only the first chunk writes the header, even when it has no rows
+                    output.write(chunk.to_csv(header=header, index=False).encode("utf-8"))
+                    row_count += len(chunk)
+                    header = False
+                if header:
+                    output.write(pd.DataFrame(columns=schema.names).to_csv(index=False).encode("utf-8"))
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return row_count
+
+
+def score_file(input_path, model_name, output_path, workers=None, chunk_size=CHUNK_SIZE, rejected_path=None):
+    """ This function scores a whole file with the preprocessing and scoring of the Bulk Predict page
+    input_path: csv or parquet file with the customer features
+    model_name: display name or artifact file name of a model in Models/new
+    output_path: csv or parquet file receiving the input rows with the prediction columns
+    workers: number of worker processes, see score_parallel
+    rejected_path: optional csv receiving the rows that failed validation with their problem
+    returns (rows scored, rows rejected)
+    raises UnknownModelError for an unknown model and SchemaError when the columns do not match the model features
+    """
+    model_name = resolve_model_name(model_name)
+    schema = output_schema(input_path)
+
+    rejected = RejectedRows(keep=MAX_REJECTED_ROWS if rejected_path else 0)
+
+    def prepared_chunks():
+        for chunk in read_chunks(input_path, chunk_size):
+            valid, invalid = prepare_and_validate(chunk)
+            rejected.add(invalid)
+            yield valid
+
+    scored = score_parallel(model_name, prepared_chunks(), workers=workers, chunk_size=chunk_size)
+    row_count = write_chunks(scored, output_path, schema)
+    if rejected_path and rejected.count:
+        rejected.rows.to_csv(rejected_path, index=False)
+    return row_count, rejected.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m Utils.batch_score",
+        description="Score a csv or parquet file of customers with one of the churn models.",
+    )
+    parser.add_argument("input", help="csv or parquet file with the customer features")
+    parser.add_argument("model", help="model name, e.g. AdaBoost, \"Logistic Regression\" or knn")
+    parser.add_argument("output", help="csv or parquet file to write the predictions to")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for large files (default 1)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help=f"rows per chunk (default {CHUNK_SIZE})")
+    parser.add_argument("--rejected", help="csv file to write the rows that failed validation to")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        row_count, rejected_count = score_file(args.input, args.model, args.output, workers=args.workers,
+                                               chunk_size=args.chunk_size, rejected_path=args.rejected)
+    except (UnknownModelError, SchemaError) as error:
+        print(f"error: {error.args[0]}", file=sys.stderr)
+        return 2
+    seconds = time.perf_counter() - start
+    print(f"scored {row_count} rows into {args.output} in {seconds:.1f} s")
+    if rejected_count:
+        print(f"{rejected_count} rows were not scored because of invalid values", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    # e.g. from cron: python -m Utils.batch_score Data/customers.parquet AdaBoost Data/scored.parquet
+    sys.exit(main())
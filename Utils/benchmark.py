@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import sklearn
+from Utils.model_registry import ENCODER_NAME, available_models, load_model, load_encoder
+from Utils.data_loader import load_rows
+from Utils.scoring import CHUNK_SIZE, score_frame, score_in_chunks
+from Utils.inference import SingleRowPredictor
+
+BATCH_SIZES = [1, 100, 10_000, 1_000_000]
+RESULTS_FILE = "benchmark_results.json"
+
+# timed runs per batch size, the big batches take long enough to be measured once or twice
+REPEATS = {1: 200, 100: 50, 10_000: 5}
+MIN_REPEATS = 1
+
+
+def peak_rss_kb():
+    """ Returns the peak resident memory of this process so far, in KB, None where it cannot be read """
+    try:
+        import resource
+    except ImportError:
+        return _peak_working_set_kb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports KB, macOS reports bytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _peak_working_set_kb():
+    # windows has no resource module, its peak working set is the same measure
+    try:
+        import ctypes
+        psapi, kernel32 = ctypes.windll.psapi, ctypes.windll.kernel32
+    except (ImportError, AttributeError, OSError):
+        return None
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong)] + [
+            (field, ctypes.c_size_t) for field in ("PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                                                    "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                                                    "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+    counters = ProcessMemoryCounters(cb=ctypes.sizeof(ProcessMemoryCounters))
+    if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize // 1024
+
+
+def synthetic_rows(rows, n, random_state=0):
+    """ This function builds n rows by drawing every column independently from rows
+    the charges get some noise so practically every row is distinct and nothing is skipped as a duplicate
+    returns a dataframe of n rows
+    """
+    rng = np.random.default_rng(random_state)
+    data = {col: rows[col].to_numpy()[rng.integers(0, len(rows), n)] for col in rows.columns}
+    for col in ["monthlycharges", "totalcharges"]:
+        data[col] = data[col] + rng.uniform(0, 1, n)
+    return pd.DataFrame(data)
+
+
+def batch_of(rows, n, random_state=0):
+    """ Returns n rows replayed from the dataset, or synthetic rows when the dataset is smaller than n """
+    if n <= len(rows):
+        return rows.sample(n, random_state=random_state)
+    return synthetic_rows(rows, n, random_state=random_state)
+
+
+def time_batches(pipeline, encoder, batch, repeats):
+    """ Scores batch repeats times and returns the latency of every run in seconds """
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        if len(batch) > CHUNK_SIZE:
+            # large inputs go through the chunked path used by bulk scoring
+            for _ in score_in_chunks(pipeline, encoder, batch):
+                pass
+        else:
+            score_frame(pipeline, encoder, batch)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+def latency_stats(latencies, rows_per_run):
+    """ Returns the p50/p99 latency in ms and the throughput of a set of timed runs """
+    return {
+        "runs": len(latencies),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "rows_per_second": float(rows_per_run / np.median(latencies)),
+    }
+
+
+def time_single_rows(pipeline, encoder, rows, repeats=REPEATS[1]):
+    """ Times the uncached single-row path of the Predict page on repeats records """
+    predictor = SingleRowPredictor(pipeline, encoder)
+    latencies = []
+    for record in rows.head(repeats).to_dict("records"):
+        start = time.perf_counter()
+        predictor.predict(record)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+def benchmark_model(name, batch_sizes=BATCH_SIZES):
+    """ This function benchmarks one artifact, run it in a fresh process so memory and load time are its own
+    name: display name from the model registry, or ENCODER_NAME for the label encoder
+    returns a dict with the load time, peak memory before and after loading, overall peak memory
+    (which includes the benchmark data) and one entry per batch size
+    """
+    rss_before_load = peak_rss_kb()
+    start = time.perf_counter()
+    model = load_encoder() if name == ENCODER_NAME else load_model(name)
+    result = {
+        "load_seconds": time.perf_counter() - start,
+        "rss_before_load_kb": rss_before_load,
+        "rss_after_load_kb": peak_rss_kb(),
+        "single_row": None,
+        "batches": [],
+    }
+    if name == ENCODER_NAME:
+        result["peak_rss_kb"] = peak_rss_kb()
+        return result
+
+    encoder = load_encoder()
+    rows = load_rows()
+    # one unmeasured run so lazy initialisation inside the libraries is not counted
+    score_frame(model, encoder, rows.head(10))
+    result["single_row"] = latency_stats(time_single_rows(model, encoder, rows), 1)
+    for batch_size in batch_sizes:
+        batch = batch_of(rows, batch_size)
+        latencies = time_batches(model, encoder, batch, REPEATS.get(batch_size, MIN_REPEATS))
+        result["batches"].append({"batch_size": batch_size, "synthetic": batch_size > len(rows), **latency_stats(latencies, batch_size)})
+    result["peak_rss_kb"] = peak_rss_kb()
+    return result
+
+
+def run_benchmarks(models=None, batch_sizes=BATCH_SIZES):
+    """ This function benchmarks every artifact in the models folder, each in its own process
+    models: optional display names to restrict the run to, the encoder is always included
+    returns the results dict written to the results file
+    """
+    names = [name for name in available_models() if not models or name in models] + [ENCODER_NAME]
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(benchmark_model, name, batch_sizes).result()
+        results.append({"model": name, **result})
+        peak_rss = "n/a" if result["peak_rss_kb"] is None else f"{result['peak_rss_kb'] / 1024:7.1f} MB"
+        print(f"{name:<20} loaded in {result['load_seconds'] * 1000:7.1f} ms, peak rss {peak_rss}")
+        if result["single_row"]:
+            print(f"{'':<20} single row     : p50 {result['single_row']['p50_ms']:10.2f} ms, p99 {result['single_row']['p99_ms']:10.2f} ms")
+        for batch in result["batches"]:
+            print(f"{'':<20} batch {batch['batch_size']:>9}: p50 {batch['p50_ms']:10.2f} ms, "
+                  f"p99 {batch['p99_ms']:10.2f} ms, {batch['rows_per_second']:12.0f} rows/s")
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "scikit-learn": sklearn.__version__,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    # python -m Utils.benchmark [--batch-sizes 1 100 10000] [--models AdaBoost KNN] [--output benchmark_results.json]
+    parser = argparse.ArgumentParser(prog="python -m Utils.benchmark", description="Benchmark load time, memory, latency and throughput of every model.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--models", nargs="+", help="display names of the models to benchmark (default all)")
+    parser.add_argument("--output", default=RESULTS_FILE, help=f"json results file (default {RESULTS_FILE})")
+    args = parser.parse_args()
+    report = run_benchmarks(models=args.models, batch_sizes=args.batch_sizes)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"results written to {args.output}")
@@ -0,0 +1,63 @@
+import math
+import numpy as np
+
+
+class CompiledPreprocessor:
+    """ The fitted num/cat ColumnTransformer of a pipeline reduced to plain lookup tables
+    (imputer fill values, scaler mean and scale, one-hot column of every category level),
+    so a single record is transformed without building a DataFrame
+    """
+
+    def __init__(self, preprocessor):
+        transformers = {name: (steps, columns) for name, steps, columns in preprocessor.transformers_ if name != "remainder"}
+        if set(transformers) != {"num", "cat"}:
+            raise ValueError("Expected a preprocessor with a 'num' and a 'cat' transformer")
+        (num_steps, num_columns), (cat_steps, cat_columns) = transformers["num"], transformers["cat"]
+        num_imputer, scaler = num_steps.named_steps["num_imputer"], num_steps.named_steps["num_scaler"]
+        cat_imputer, one_hot = cat_steps.named_steps["cat_imputer"], cat_steps.named_steps["cat-encoder"]
+        if one_hot.drop_idx_ is not None or one_hot.handle_unknown != "ignore":
+            raise ValueError("Only one-hot encoders without dropped columns that ignore unknown levels are supported")
+
+        self.numeric_columns = list(num_columns)
+        self.categorical_columns = list(cat_columns)
+        self.numeric_fill = num_imputer.statistics_.astype(float)
+        self.numeric_mean = scaler.mean_ if scaler.with_mean else np.zeros(len(self.numeric_columns))
+        self.numeric_scale = scaler.scale_ if scaler.with_std else np.ones(len(self.numeric_columns))
+        self.numeric_slice = preprocessor.output_indices_["num"]
+        self.categorical_fill = list(cat_imputer.statistics_)
+
+        # output column of every (feature, level) pair, unknown levels have no column
+        offset = preprocessor.output_indices_["cat"].start
+        self.level_positions = []
+        for levels in one_hot.categories_:
+            self.level_positions.append({level: offset + i for i, level in enumerate(levels)})
+            offset += len(levels)
+        self.n_features = offset
+
+    def transform_record(self, record, out):
+        """ Writes the transformed features of one record (dict keyed by feature name) into out, a 1-D float array """
+        out[:] = 0.0
+        numeric = np.array([to_float(record.get(col)) for col in self.numeric_columns])
+        numeric = np.where(np.isnan(numeric), self.numeric_fill, numeric)
+        out[self.numeric_slice] = (numeric - self.numeric_mean) / self.numeric_scale
+        for col, fill, positions in zip(self.categorical_columns, self.categorical_fill, self.level_positions):
+            value = record.get(col)
+            position = positions.get(fill if is_nan_value(value) else value)
+            if position is not None:
+                out[position] = 1.0
+        return out
+
+
+def is_nan_value(value):
+    """ Returns True for NaN, the only missing value the fitted imputers fill in,
+    like the original pipeline a None in a categorical column is scored as an unknown level
+    """
+    return isinstance(value, float) and math.isnan(value)
+
+
+def to_float(value):
+    """ Returns value as a float, NaN when it cannot be read as a number """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
@@ -0,0 +1,399 @@
+import io
+import os
+import time
+import hashlib
+import threading
+import joblib
+import numpy as np
+import pandas as pd
+from Utils.data_loader import DEPLOYMENT_DATA, CATEGORICAL_COLUMNS, apply_schema, load_dataset
+from Utils.quantile_sketch import QuantileSketch
+
+# dataset behind the Dashboard page
+DASHBOARD_DATA = DEPLOYMENT_DATA
+
+# numeric columns summarised with histograms and box plots
+NUMERIC_COLUMNS = ["tenure", "monthlycharges", "totalcharges"]
+HISTOGRAM_BINS = 40
+
+# (category, value) pairs drawn as bar charts of the value summed per category and churn
+BAR_CHARTS = [
+    ("internetservice", "monthlycharges"),
+    ("gender", "seniorcitizen"),
+    ("multiplelines", "monthlycharges"),
+    ("contract", "monthlycharges"),
+    ("streamingtv", "monthlycharges"),
+    ("techsupport", "monthlycharges"),
+]
+
+# most rows sent to the browser for charts that need individual points (scatter, violin, contour)
+MAX_CHART_POINTS = 2000
+
+# running aggregates of DASHBOARD_DATA, kept between server restarts
+DASHBOARD_STATE = "./Data/Customer_churn_Deployment_data.dashboard.joblib"
+# bumped whenever DashboardAggregates changes, older saved states are rebuilt from the csv
+STATE_FORMAT = 2
+# numeric columns of the correlation matrix
+CORRELATION_COLUMNS = ["seniorcitizen"] + NUMERIC_COLUMNS
+# points kept per churn label for the point-based charts, the most the page lets users ask for
+SAMPLE_CAPACITY = 50_000
+# bytes read at a time when hashing the part of the csv already counted
+HASH_BLOCK_BYTES = 1024 * 1024
+# below this csv size parsing the whole file is faster than loading and updating the running aggregates
+INCREMENTAL_MIN_BYTES = 2 * 1024 * 1024
+# rows of the csv parsed and added to the aggregates at a time
+UPDATE_CHUNK_ROWS = 50_000
+
+
+def dataset_version(path=DASHBOARD_DATA):
+    """ Returns (modification time, size) of the dataset, used as the cache key for its aggregates """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_dashboard_data(path=DASHBOARD_DATA):
+    """ Returns the typed dashboard dataset shared with the Data page """
+    return load_dataset(path)
+
+
+def histogram(values, bins=HISTOGRAM_BINS):
+    """ Returns a dataframe of bin start, end and count for a numeric series """
+    counts, edges = np.histogram(values.dropna(), bins=bins)
+    return pd.DataFrame({"start": edges[:-1], "end": edges[1:], "count": counts})
+
+
+def box_stats(values):
+    """ Returns the quartiles, whiskers (1.5 IQR fences), mean and count of a numeric series """
+    values = values.dropna()
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    return {
+        "q1": q1,
+        "median": median,
+        "q3": q3,
+        "lowerfence": values[values >= q1 - 1.5 * iqr].min(),
+        "upperfence": values[values <= q3 + 1.5 * iqr].max(),
+        "mean": values.mean(),
+        "count": len(values),
+    }
+
+
+def compute_aggregates(df):
+    """ This function computes every statistic the Dashboard page displays
+    df: dashboard dataframe
+    returns a dict of KPI values, churn counts, histograms, box plot statistics and the correlation matrix
+    """
+    churn_counts = df["churn"].value_counts()
+    by_churn = df.groupby("churn", observed=True)
+    return {
+        "kpis": {
+            "avg_tenure": df["tenure"].mean(),
+            "avg_monthly_charges": df["monthlycharges"].mean(),
+            "churn_rate": churn_counts.get("Yes", 0) / churn_counts.sum() * 100,
+            "total_customers": len(df),
+            "contract_counts": df["contract"].value_counts(),
+        },
+        "churn_counts": churn_counts,
+        "histograms": {col: histogram(df[col]) for col in NUMERIC_COLUMNS},
+        "box": {col: box_stats(df[col]) for col in NUMERIC_COLUMNS},
+        "box_by_churn": {col: {label: box_stats(group) for label, group in by_churn[col]} for col in NUMERIC_COLUMNS},
+        "correlation": df.select_dtypes("number").corr(),
+    }
+
+
+def category_totals(df, category, value, color="churn"):
+    """ Returns value summed per category and color, what a bar chart of the raw rows would stack """
+    return df.groupby([category, color], observed=True)[value].sum().reset_index()
+
+
+def sample_points(df, columns, max_points=MAX_CHART_POINTS, stratify="churn", random_state=42):
+    """ This function downsamples rows for point-based charts
+    keeps the share of each stratify group so the churn split looks the same as in the full data
+    returns at most about max_points rows of the given columns
+    """
+    if len(df) <= max_points:
+        return df[columns]
+    fraction = max_points / len(df)
+    return df.groupby(stratify, group_keys=False, observed=True)[columns].sample(frac=fraction, random_state=random_state)
+
+
+def prepare_chart_data(df, max_points=MAX_CHART_POINTS):
+    """ This function prepares the data of the Dashboard charts that are not built from compute_aggregates
+    returns a dict with the bar chart totals keyed on (category, value) and a sample of points
+    """
+    return {
+        "bars": {(category, value): category_totals(df, category, value) for category, value in BAR_CHARTS},
+        "points": sample_points(df, NUMERIC_COLUMNS + ["churn"], max_points=max_points),
+    }
+
+
+def _add_totals(totals, series):
+    # adds the values of a series to a dict keyed on its index
+    for key, value in series.items():
+        totals[key] = totals.get(key, 0) + value
+
+
+def _comoments(x, y):
+    # (rows, mean of x, mean of y, sum of squared deviations of x and of y, co-moment) over the rows with both values
+    present = (x.notna() & y.notna()).to_numpy()
+    x, y = x.to_numpy(dtype=float)[present], y.to_numpy(dtype=float)[present]
+    if not len(x):
+        return np.zeros(6)
+    dx, dy = x - x.mean(), y - y.mean()
+    return np.array([len(x), x.mean(), y.mean(), dx @ dx, dy @ dy, dx @ dy])
+
+
+def _merge_comoments(a, b):
+    # comoments of the union of two sets of rows, combined without revisiting them
+    rows = a[0] + b[0]
+    if not rows:
+        return a
+    dx, dy, weight = b[1] - a[1], b[2] - a[2], a[0] * b[0] / rows
+    return np.array([rows, a[1] + dx * b[0] / rows, a[2] + dy * b[0] / rows,
+                     a[3] + b[3] + dx * dx * weight, a[4] + b[4] + dy * dy * weight, a[5] + b[5] + dx * dy * weight])
+
+
+def sketch_histogram(sketch, bins=HISTOGRAM_BINS):
+    """ Same as histogram for the values summarised in a QuantileSketch """
+    counts, edges = sketch.histogram(bins)
+    return pd.DataFrame({"start": edges[:-1], "end": edges[1:], "count": counts})
+
+
+def sketch_box_stats(sketch):
+    """ Same as box_stats for the values summarised in a QuantileSketch """
+    q1, median, q3 = sketch.quantiles([0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    values, counts = sketch.buckets()
+    return {
+        "q1": q1,
+        "median": median,
+        "q3": q3,
+        "lowerfence": values[values >= q1 - 1.5 * iqr].min(),
+        "upperfence": values[values <= q3 + 1.5 * iqr].max(),
+        "mean": sketch.mean(),
+        "count": sketch.count,
+    }
+
+
+def _digest(handle, offset):
+    # md5 of the first offset bytes of the file, the handle is left at offset
+    digest = hashlib.md5()
+    handle.seek(0)
+    remaining = offset
+    while remaining:
+        block = handle.read(min(HASH_BLOCK_BYTES, remaining))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+    return digest
+
+
+class DashboardAggregates:
+    """ Running statistics of the dashboard csv, updated with the rows appended to it
+    instead of rescanning the whole file.
+    Counts, sums, means, the churn rate and the correlation matrix are exact; quartiles and
+    histograms come from QuantileSketch, within its relative accuracy; the chart points are a
+    uniform random sample per churn label, the rows with the smallest random keys seen so far.
+    """
+
+    def __init__(self, source, random_state=42):
+        self.format = STATE_FORMAT
+        self.source = os.path.abspath(source)
+        self.rows = 0
+        self.sketches = {col: QuantileSketch() for col in NUMERIC_COLUMNS}
+        self.sketches_by_churn = {col: {} for col in NUMERIC_COLUMNS}
+        self.category_counts = {col: {} for col in CATEGORICAL_COLUMNS}
+        self.bar_totals = {chart: {} for chart in BAR_CHARTS}
+        self.comoments = {(a, b): np.zeros(6) for i, a in enumerate(CORRELATION_COLUMNS) for b in CORRELATION_COLUMNS[i:]}
+        self.samples = {}
+        self.rng = np.random.default_rng(random_state)
+        # bytes of the csv already counted, their md5, its column names, whether the counted bytes
+        # end with a line break and the (modification time, size) of the csv at the last update
+        self.offset = 0
+        self.digest = hashlib.md5().hexdigest()
+        self.columns = None
+        self.terminated = True
+        self.version = None
+
+    def update(self, df):
+        """ Adds the rows of a typed dataframe (see apply_schema) to the aggregates """
+        self.rows += len(df)
+        churn = df["churn"].astype(object)
+        for col in NUMERIC_COLUMNS:
+            self.sketches[col].update(df[col])
+            for label, values in df[col].groupby(churn):
+                self.sketches_by_churn[col].setdefault(label, QuantileSketch()).update(values)
+        for col in CATEGORICAL_COLUMNS:
+            counts = df[col].value_counts()
+            _add_totals(self.category_counts[col], counts[counts > 0])
+        for category, value in BAR_CHARTS:
+            _add_totals(self.bar_totals[(category, value)], df.groupby([category, "churn"], observed=True)[value].sum())
+        for a, b in self.comoments:
+            self.comoments[(a, b)] = _merge_comoments(self.comoments[(a, b)], _comoments(df[a], df[b]))
+
+        # every row gets a random key, each label keeps the rows with the smallest keys
+        rows = df[NUMERIC_COLUMNS].assign(churn=churn, key=self.rng.random(len(df)))
+        for label, group in rows.groupby("churn"):
+            self.samples[label] = pd.concat([self.samples.get(label), group]).nsmallest(SAMPLE_CAPACITY, "key")
+
+    def update_from_csv(self, handle, chunk_rows=UPDATE_CHUNK_ROWS):
+        """ This function adds the rows appended to an open csv since the last update
+        every byte counted so far is checked against its md5 whenever the file changed, and a last
+        row without a line break is counted, the file then has to continue with a new line
+        returns the number of rows added, or None when the counted part of the file was edited or
+        replaced and the aggregates have to be built again from the start
+        """
+        stat = os.fstat(handle.fileno())
+        version = stat.st_mtime_ns, stat.st_size
+        if version == self.version:
+            return 0
+        if stat.st_size < self.offset:
+            return None
+        digest = _digest(handle, self.offset)
+        if digest.hexdigest() != self.digest:
+            return None
+        data = handle.read()
+        if not self.terminated and data[:1] not in (b"", b"\n", b"\r"):
+            # the last row counted has grown since
+            return None
+        digest.update(data)
+
+        counted = len(data)
+        if self.columns is None and data:
+            header, _, data = data.partition(b"\n")
+            self.columns = pd.read_csv(io.BytesIO(header), nrows=0).columns.tolist()
+        rows = 0
+        if data.strip():
+            # the first column of the csv is the saved index
+            for chunk in pd.read_csv(io.BytesIO(data), header=None, names=self.columns, index_col=0, chunksize=chunk_rows):
+                self.update(apply_schema(chunk))
+                rows += len(chunk)
+        if counted:
+            self.terminated = data.endswith(b"\n")
+        self.offset += counted
+        self.digest = digest.hexdigest()
+        self.version = version
+        return rows
+
+    def aggregates(self):
+        """ Returns the statistics of compute_aggregates from the running aggregates """
+        churn_counts = pd.Series(self.category_counts["churn"], name="count", dtype=int).rename_axis("churn").sort_values(ascending=False)
+        contract_counts = pd.Series(self.category_counts["contract"], name="count", dtype=int).rename_axis("contract").sort_values(ascending=False)
+        return {
+            "kpis": {
+                "avg_tenure": self.sketches["tenure"].mean(),
+                "avg_monthly_charges": self.sketches["monthlycharges"].mean(),
+                "churn_rate": churn_counts.get("Yes", 0) / churn_counts.sum() * 100,
+                "total_customers": self.rows,
+                "contract_counts": contract_counts,
+            },
+            "churn_counts": churn_counts,
+            "histograms": {col: sketch_histogram(self.sketches[col]) for col in NUMERIC_COLUMNS},
+            "box": {col: sketch_box_stats(self.sketches[col]) for col in NUMERIC_COLUMNS},
+            "box_by_churn": {col: {label: sketch_box_stats(sketch) for label, sketch in sorted(self.sketches_by_churn[col].items())}
+                             for col in NUMERIC_COLUMNS},
+            "correlation": self.correlation(),
+        }
+
+    def correlation(self):
+        """ Returns the pearson correlation matrix of CORRELATION_COLUMNS, like DataFrame.corr """
+        matrix = pd.DataFrame(np.nan, index=CORRELATION_COLUMNS, columns=CORRELATION_COLUMNS)
+        for (a, b), (rows, _, _, squares_a, squares_b, comoment) in self.comoments.items():
+            if rows > 1 and squares_a > 0 and squares_b > 0:
+                matrix.loc[a, b] = matrix.loc[b, a] = comoment / np.sqrt(squares_a * squares_b)
+        return matrix
+
+    def chart_data(self, max_points=MAX_CHART_POINTS):
+        """ Returns the chart data of prepare_chart_data from the running aggregates """
+        bars = {}
+        for (category, value), totals in self.bar_totals.items():
+            rows = [(level, label, total) for (level, label), total in sorted(totals.items())]
+            bars[(category, value)] = pd.DataFrame(rows, columns=[category, "churn", value])
+
+        # each label keeps its share of the rows, as in sample_points
+        total = sum(self.category_counts["churn"].values())
+        points = []
+        for label, sample in sorted(self.samples.items()):
+            size = len(sample) if total <= max_points else round(self.category_counts["churn"][label] * max_points / total)
+            points.append(sample.nsmallest(size, "key"))
+        points = pd.concat(points).drop(columns="key") if points else pd.DataFrame(columns=NUMERIC_COLUMNS + ["churn"])
+        return {"bars": bars, "points": points}
+
+
+# running aggregates of every csv summarised in this process, keyed on its absolute path
+_aggregates = {}
+_lock = threading.Lock()
+
+
+def _read_state(path, state_path):
+    try:
+        aggregates = joblib.load(state_path)
+    except Exception:
+        return None
+    if getattr(aggregates, "format", None) != STATE_FORMAT or aggregates.source != os.path.abspath(path):
+        return None
+    return aggregates
+
+
+def _write_state(aggregates, state_path):
+    # write next to the state and swap it in, so a crash never leaves a partial file
+    temporary_path = f"{state_path}.tmp"
+    joblib.dump(aggregates, temporary_path)
+    os.replace(temporary_path, state_path)
+
+
+def refresh_aggregates(path=DASHBOARD_DATA, state_path=DASHBOARD_STATE):
+    """ This function brings the running aggregates of a csv up to date
+    only the rows appended since the last update are read, a csv that was rewritten
+    rather than appended to is counted again from its first row;
+    the aggregates are saved to state_path so a restarted server carries on from them
+    call it while holding _lock, returns the DashboardAggregates of the csv
+    """
+    key = os.path.abspath(path)
+    aggregates = _aggregates.get(key) or _read_state(path, state_path)
+    version = aggregates.version if aggregates is not None else None
+    with open(path, "rb") as handle:
+        if aggregates is None or aggregates.update_from_csv(handle) is None:
+            aggregates = DashboardAggregates(path)
+            aggregates.update_from_csv(handle)
+    if aggregates.version != version or not os.path.exists(state_path):
+        _write_state(aggregates, state_path)
+    _aggregates[key] = aggregates
+    return aggregates
+
+
+def dashboard_aggregates(path=DASHBOARD_DATA, state_path=DASHBOARD_STATE):
+    """ Returns the statistics of compute_aggregates for the csv, updated from its appended rows
+    once it is larger than INCREMENTAL_MIN_BYTES and computed from the whole file below that
+    """
+    if os.path.getsize(path) < INCREMENTAL_MIN_BYTES:
+        return compute_aggregates(load_dashboard_data(path))
+    with _lock:
+        return refresh_aggregates(path, state_path).aggregates()
+
+
+def dashboard_chart_data(max_points=MAX_CHART_POINTS, path=DASHBOARD_DATA, state_path=DASHBOARD_STATE):
+    """ Returns the chart data of prepare_chart_data for the csv, like dashboard_aggregates """
+    if os.path.getsize(path) < INCREMENTAL_MIN_BYTES:
+        return prepare_chart_data(load_dashboard_data(path), max_points=max_points)
+    with _lock:
+        return refresh_aggregates(path, state_path).chart_data(max_points)
+
+
+if __name__ == "__main__":
+    # python -m Utils.dashboard_data: running aggregates against a full recomputation of the deployment data
+    start = time.perf_counter()
+    with _lock:
+        incremental = refresh_aggregates().aggregates()
+    incremental_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    full = compute_aggregates(load_dashboard_data())
+    full_seconds = time.perf_counter() - start
+    for name in ("avg_tenure", "avg_monthly_charges", "churn_rate", "total_customers"):
+        print(f"{name:<20} running {incremental['kpis'][name]:.4f}  full {full['kpis'][name]:.4f}")
+    for col in NUMERIC_COLUMNS:
+        print(f"{col:<20} median running {incremental['box'][col]['median']:.2f}  full {full['box'][col]['median']:.2f}")
+    difference = (incremental["correlation"] - full["correlation"].loc[CORRELATION_COLUMNS, CORRELATION_COLUMNS]).abs().max().max()
+    print(f"correlation max difference {difference:.1e}")
+    print(f"update {incremental_seconds * 1000:.1f} ms, full recomputation {full_seconds * 1000:.1f} ms")
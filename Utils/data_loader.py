@@ -0,0 +1,163 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from Utils.preprocessing import prepare_and_validate
+
+# customer dataset shown on the Data page and summarised on the Dashboard
+DEPLOYMENT_DATA = "./Data/Customer_churn_Deployment_data.csv"
+# typed parquet copy of DEPLOYMENT_DATA, rebuilt whenever the csv changes
+DEPLOYMENT_SNAPSHOT = "./Data/Customer_churn_Deployment_data.parquet"
+
+# explicit schema of the deployment dataset, low-cardinality text columns become categoricals
+CATEGORICAL_COLUMNS = [
+    "gender", "partner", "dependents", "phoneservice", "multiplelines", "internetservice",
+    "onlinesecurity", "onlinebackup", "deviceprotection", "techsupport", "streamingtv",
+    "streamingmovies", "contract", "paperlessbilling", "paymentmethod", "churn",
+]
+# nullable integers, so a blank tenure or seniorcitizen stays a missing value the pipelines impute
+NUMERIC_DTYPES = {"seniorcitizen": "Int8", "tenure": "Int16", "monthlycharges": "float64", "totalcharges": "float64"}
+
+# rows parsed between two progress updates
+READ_CHUNK_ROWS = 1000
+
+# number of parsed datasets (default file plus recent uploads) kept for later reruns and sessions
+CACHE_SIZE = 4
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _source_size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+
+def read_csv_with_progress(source, on_progress=None, chunk_size=READ_CHUNK_ROWS, **read_csv_kwargs):
+    """ This function reads a csv in chunks and reports how much of it has been consumed
+    source: path or binary file object (e.g. a streamlit UploadedFile)
+    on_progress: optional callable receiving the fraction of bytes read so far, between 0 and 1
+    read_csv_kwargs: extra arguments for pd.read_csv
+    returns the full dataframe
+    """
+    total_bytes = _source_size(source) or 1
+    handle = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        chunks = []
+        for chunk in pd.read_csv(handle, chunksize=chunk_size, **read_csv_kwargs):
+            chunks.append(chunk)
+            if on_progress is not None:
+                on_progress(min(handle.tell() / total_bytes, 1.0))
+    finally:
+        if handle is not source:
+            handle.close()
+    if on_progress is not None:
+        on_progress(1.0)
+    return pd.concat(chunks) if chunks else pd.DataFrame()
+
+
+def _cache_key(source):
+    if isinstance(source, (str, os.PathLike)):
+        stat = os.stat(source)
+        return os.path.abspath(source), stat.st_mtime_ns, stat.st_size
+    return hashlib.md5(source.getvalue()).hexdigest()
+
+
+def load_csv(source, on_progress=None):
+    """ This function returns the parsed csv, reading it only if it changed since the last call
+    source: path (cached on modification time and size) or in-memory file object (cached on its content)
+    on_progress: progress callback, only called when the file actually has to be read
+    returns a dataframe shared by every caller, copy it before modifying it
+    """
+    key = _cache_key(source)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    df = read_csv_with_progress(source, on_progress=on_progress)
+    with _lock:
+        _cache[key] = df
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return df
+
+
+def apply_schema(df):
+    """ Casts the deployment dataset columns present in df to their explicit dtypes """
+    # raw exports hold blanks, e.g. for customers without charges yet, they are read as missing values
+    df = df.assign(**{col: pd.to_numeric(df[col], errors="coerce").astype(dtype) for col, dtype in NUMERIC_DTYPES.items() if col in df.columns})
+    # categories are set once on the whole frame, so every chunk shares the same levels
+    return df.astype({col: "category" for col in CATEGORICAL_COLUMNS if col in df.columns})
+
+
+def _csv_version(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _read_snapshot(snapshot_path, version):
+    if not os.path.exists(snapshot_path):
+        return None
+    metadata = pq.read_schema(snapshot_path).metadata or {}
+    if json.loads(metadata.get(b"source_version", b"null")) != version:
+        return None
+    return pq.read_table(snapshot_path).to_pandas()
+
+
+def _write_snapshot(df, snapshot_path, version):
+    table = pa.Table.from_pandas(df)
+    metadata = {**(table.schema.metadata or {}), b"source_version": json.dumps(version).encode()}
+    # write next to the snapshot and swap it in, so readers never see a partial file;
+    # every writer has its own temporary file, two sessions rebuilding the snapshot at once do not collide
+    handle, temporary_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(snapshot_path) or ".")
+    os.close(handle)
+    try:
+        pq.write_table(table.replace_schema_metadata(metadata), temporary_path)
+        os.replace(temporary_path, snapshot_path)
+    except Exception:
+        os.remove(temporary_path)
+        raise
+
+
+def load_dataset(path=DEPLOYMENT_DATA, snapshot_path=DEPLOYMENT_SNAPSHOT, on_progress=None):
+    """ This function returns the typed deployment dataset
+    the csv is parsed only when it changed since the parquet snapshot was written,
+    otherwise the snapshot is read, and the frame is kept in memory for every session
+    on_progress: progress callback, only called when the csv actually has to be parsed
+    returns a dataframe shared by every caller, copy it before modifying it
+    """
+    version = _csv_version(path)
+    key = ("dataset", os.path.abspath(path), *version)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    df = _read_snapshot(snapshot_path, version)
+    if df is None:
+        # the first column of the csv is the saved index
+        df = apply_schema(read_csv_with_progress(path, on_progress=on_progress, index_col=0))
+        _write_snapshot(df, snapshot_path, version)
+
+    with _lock:
+        _cache[key] = df
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return df
+
+
+def load_rows(path=DEPLOYMENT_DATA):
+    """ Returns the valid rows of the dataset as the Bulk Predict page prepares them,
+    the model input used by the benchmark, the parity checks and the tests
+    """
+    valid, _ = prepare_and_validate(pd.read_csv(path, index_col=0))
+    return valid.reset_index(drop=True)
@@ -0,0 +1,125 @@
+import weakref
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import joblib
+import numpy as np
+import pandas as pd
+from Utils.model_registry import discover_models, load_model, load_encoder
+from Utils.inference import get_predictor
+
+ENSEMBLE_NAME = "Ensemble (soft vote)"
+
+# fingerprint of every fitted preprocessor seen, dropped with the preprocessor when a model is unloaded
+_fingerprints = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def ensemble_models():
+    """ Returns the display names of the pipelines shipped in the models folder, the members of the ensemble """
+    return list(discover_models())
+
+
+def preprocessor_fingerprint(pipeline):
+    """ Returns a hash of the fitted preprocessor of a pipeline, equal for pipelines that transform identically """
+    preprocessor = pipeline.named_steps["preprocessor"]
+    with _lock:
+        if preprocessor not in _fingerprints:
+            _fingerprints[preprocessor] = joblib.hash(preprocessor)
+        return _fingerprints[preprocessor]
+
+
+def _shared_features(pipelines, transform):
+    # transform(name) runs once per distinct fitted preprocessor, models with the same one share its output
+    features, by_model = {}, {}
+    for name, pipeline in pipelines.items():
+        fingerprint = preprocessor_fingerprint(pipeline)
+        if fingerprint not in features:
+            features[fingerprint] = transform(name)
+        by_model[name] = features[fingerprint]
+    return by_model
+
+
+def _classify(pipelines, features, n_classes, concurrent):
+    # probabilities of every model, one column per encoder class whatever the order of the classifier's classes
+    def run(name):
+        classifier = pipelines[name].steps[-1][1]
+        model_features = features[name]
+        proba = np.zeros((len(model_features), n_classes))
+        proba[:, classifier.classes_] = classifier.predict_proba(model_features)
+        return proba
+
+    names = list(pipelines)
+    if concurrent and len(names) > 1:
+        # numpy, sklearn and xgboost release the GIL in their heavy loops
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            return dict(zip(names, executor.map(run, names)))
+    return {name: run(name) for name in names}
+
+
+def soft_vote(per_model):
+    """ Returns the average of the class probabilities of every model """
+    return np.mean(list(per_model.values()), axis=0)
+
+
+def ensemble_proba(df, model_names=None, concurrent=False):
+    """ This function scores a dataframe with several models in one pass
+    df: prepared rows with the model features
+    model_names: display names of the models, all shipped models by default
+    concurrent: run the classifiers in parallel threads
+    returns (dict of model name -> class probabilities, soft vote probabilities),
+    the columns of every array follow the classes of the label encoder
+    """
+    pipelines = {name: load_model(name) for name in model_names or ensemble_models()}
+    features = _shared_features(pipelines, lambda name: pipelines[name].named_steps["preprocessor"].transform(df))
+    per_model = _classify(pipelines, features, len(load_encoder().classes_), concurrent)
+    return per_model, soft_vote(per_model)
+
+
+def ensemble_record(record, model_names=None, concurrent=False):
+    """ Same as ensemble_proba for a single record (dict keyed by feature name),
+    transformed through the lookup tables of the single-row predictors instead of a DataFrame
+    """
+    model_names = model_names or ensemble_models()
+    predictors = {name: get_predictor(name) for name in model_names}
+
+    def transform(name):
+        predictor = predictors[name]
+        if predictor.preprocessor is None:
+            return predictor.pipeline.named_steps["preprocessor"].transform(pd.DataFrame([record]))
+        features = np.zeros((1, predictor.preprocessor.n_features))
+        predictor.preprocessor.transform_record(record, features[0])
+        return features
+
+    pipelines = {name: predictor.pipeline for name, predictor in predictors.items()}
+    per_model = _classify(pipelines, _shared_features(pipelines, transform), len(load_encoder().classes_), concurrent)
+    return per_model, soft_vote(per_model)
+
+
+def decode(proba, encoder):
+    """ Returns (labels, probability of each label) for class probabilities following the encoder classes """
+    best = proba.argmax(axis=1)
+    return encoder.classes_[best], proba[np.arange(len(best)), best]
+
+
+def score_ensemble_frame(df, model_names=None, concurrent=False, prediction_time=None):
+    """ This function scores a dataframe with every model and their soft vote
+    returns a copy of df with a Prediction and Probability column per model, then
+    PredictionTime, Prediction and PredictionProbability of the soft vote
+    """
+    encoder = load_encoder()
+    per_model, vote = ensemble_proba(df, model_names=model_names, concurrent=concurrent)
+    columns = {}
+    for name, proba in per_model.items():
+        columns[f"{name} Prediction"], columns[f"{name} Probability"] = decode(proba, encoder)
+    labels, probability = decode(vote, encoder)
+    return df.assign(**columns, PredictionTime=prediction_time or datetime.date.today(),
+                     Prediction=labels, PredictionProbability=probability)
+
+
+def score_ensemble_in_chunks(chunks, model_names=None, concurrent=False):
+    """ Yields score_ensemble_frame of every non-empty chunk, all with the same timestamp """
+    prediction_time = datetime.date.today()
+    for chunk in chunks:
+        if len(chunk):
+            yield score_ensemble_frame(chunk, model_names=model_names, concurrent=concurrent, prediction_time=prediction_time)
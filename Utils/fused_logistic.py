@@ -0,0 +1,134 @@
+import time
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+from sklearn.linear_model import LogisticRegression
+from Utils.compiled_preprocessor import CompiledPreprocessor, is_nan_value, to_float
+
+# largest difference in probability accepted between the fused tables and the original pipeline
+PARITY_TOLERANCE = 1e-9
+PARITY_ROWS = 2000
+
+
+class FusedLogisticPipeline:
+    """ A fitted preprocessor + binary LogisticRegression pipeline folded into score tables.
+    The linear score of a row is a constant, plus one table lookup per categorical feature
+    (the coefficient of its one-hot column), plus the imputed numeric values times their
+    coefficients divided by the scaler's scale, so no feature matrix is ever built.
+    """
+
+    def __init__(self, pipeline):
+        classifier = pipeline.steps[-1][1]
+        if not isinstance(classifier, LogisticRegression) or classifier.coef_.shape[0] != 1:
+            raise ValueError("Only pipelines ending with a binary LogisticRegression can be fused")
+        self.preprocessor = CompiledPreprocessor(pipeline.named_steps["preprocessor"])
+        self.classes_ = classifier.classes_
+        self.feature_names_in_ = pipeline.feature_names_in_
+        coef = classifier.coef_[0]
+
+        # (x - mean) / scale * coef == x * coef / scale - mean * coef / scale
+        prep = self.preprocessor
+        self.numeric_weights = coef[prep.numeric_slice] / prep.numeric_scale
+        self.intercept = classifier.intercept_[0] - (self.numeric_weights * prep.numeric_mean).sum()
+
+        # score of every level of every categorical feature, unknown levels score 0 like their all-zero one-hot row
+        self.level_scores = [{level: coef[position] for level, position in positions.items()} for positions in prep.level_positions]
+        self.fill_scores = [scores.get(fill, 0.0) for scores, fill in zip(self.level_scores, prep.categorical_fill)]
+        self.level_index = [pd.Index(list(scores)) for scores in self.level_scores]
+        self.score_tables = [np.append(list(scores.values()), 0.0) for scores in self.level_scores]
+
+    def decision_function(self, df):
+        """ Returns the linear score of every row of a dataframe with the model features """
+        prep = self.preprocessor
+        numeric = df[prep.numeric_columns].to_numpy(dtype=float)
+        numeric = np.where(np.isnan(numeric), prep.numeric_fill, numeric)
+        score = self.intercept + numeric @ self.numeric_weights
+        for col, index, table, fill_score in zip(prep.categorical_columns, self.level_index, self.score_tables, self.fill_scores):
+            values = df[col]
+            # position -1 (unknown level) picks the trailing 0 of the table
+            score += np.where(_nan_mask(values), fill_score, table[_level_positions(values, index)])
+        return score
+
+    def predict_proba(self, df):
+        """ Returns the class probabilities of every row, like LogisticRegression.predict_proba """
+        positive = expit(self.decision_function(df))
+        return np.column_stack([1 - positive, positive])
+
+    def predict_proba_record(self, record):
+        """ Returns the class probabilities of one record (dict keyed by feature name) """
+        prep = self.preprocessor
+        score = self.intercept
+        for col, fill, weight in zip(prep.numeric_columns, prep.numeric_fill, self.numeric_weights):
+            value = to_float(record.get(col))
+            score += weight * (fill if np.isnan(value) else value)
+        for col, scores, fill_score in zip(prep.categorical_columns, self.level_scores, self.fill_scores):
+            value = record.get(col)
+            score += fill_score if is_nan_value(value) else scores.get(value, 0.0)
+        positive = expit(score)
+        return np.array([1 - positive, positive])
+
+    def predict(self, df):
+        return self.classes_[self.predict_proba(df).argmax(axis=1)]
+
+
+def _nan_mask(values):
+    # the rows the categorical imputer fills: NaN, but not None, which it leaves to the encoder as an unknown level;
+    # a categorical column reaches the imputer as an object array with NaN for every missing value
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.isna().to_numpy()
+    values = values.to_numpy()
+    return values != values
+
+
+def _level_positions(values, index):
+    # position of every value in index, -1 for values not in it
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # look up the few categories once and expand them through the integer codes
+        return np.append(index.get_indexer(values.cat.categories), -1)[values.cat.codes.to_numpy()]
+    return index.get_indexer(values)
+
+
+def parity_sample(fused, n_rows=PARITY_ROWS, random_state=0):
+    """ This function builds raw feature rows for a parity check
+    numbers around the training mean, every known category level plus an unknown one,
+    and a few missing values in every column
+    returns a dataframe of n_rows rows
+    """
+    rng = np.random.default_rng(random_state)
+    prep = fused.preprocessor
+    data = {}
+    for col, mean, scale in zip(prep.numeric_columns, prep.numeric_mean, prep.numeric_scale):
+        data[col] = np.where(rng.random(n_rows) < 0.05, np.nan, rng.normal(mean, 2 * scale, n_rows))
+    for col, scores in zip(prep.categorical_columns, fused.level_scores):
+        levels = np.array(list(scores) + ["unknown level", np.nan], dtype=object)
+        data[col] = levels[rng.integers(0, len(levels), n_rows)]
+    return pd.DataFrame(data)
+
+
+def fuse_logistic_pipeline(pipeline, tolerance=PARITY_TOLERANCE):
+    """ This function turns a logistic regression pipeline into its fused score tables
+    the fused pipeline is only returned after it matched the original on a parity sample
+    raises ValueError when the probabilities differ from the original by more than tolerance
+    """
+    fused = FusedLogisticPipeline(pipeline)
+    sample = parity_sample(fused)
+    difference = float(np.abs(pipeline.predict_proba(sample) - fused.predict_proba(sample)).max())
+    if difference > tolerance:
+        raise ValueError(f"Fused logistic regression differs from the original by {difference:.2e}")
+    return fused
+
+
+if __name__ == "__main__":
+    # python -m Utils.fused_logistic: parity and speed against the original pipeline on the deployment data
+    from Utils.model_registry import load_model
+    from Utils.data_loader import load_rows
+    rows = load_rows()
+    original, fused = load_model("Logistic Regression"), load_model("Logistic Regression (fused tables)")
+    results = []
+    for model in (original, fused):
+        start = time.perf_counter()
+        proba = model.predict_proba(rows)
+        results.append((time.perf_counter() - start, proba))
+    (original_seconds, original_proba), (fused_seconds, fused_proba) = results
+    print(f"max difference {np.abs(original_proba - fused_proba).max():.1e}, "
+          f"original {original_seconds * 1000:.1f} ms, fused {fused_seconds * 1000:.1f} ms for {len(rows)} rows")
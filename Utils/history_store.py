@@ -0,0 +1,351 @@
+import io
+import os
+import time
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
+from contextlib import closing
+import pandas as pd
+
+# sqlite database holding every prediction made from the Predict page
+HISTORY_DB = "./Data/prediction_history.db"
+# csv log written by earlier versions of the app, imported once into HISTORY_DB
+LEGACY_HISTORY_CSV = "./Data/prediction_history.csv"
+
+# input features in the order the Predict page collects them, with their sqlite types
+FEATURE_COLUMNS = {
+    "gender": "TEXT",
+    "seniorcitizen": "TEXT",
+    "partner": "TEXT",
+    "tenure": "INTEGER",
+    "monthlycharges": "REAL",
+    "totalcharges": "REAL",
+    "paymentmethod": "TEXT",
+    "contract": "TEXT",
+    "paperlessbilling": "TEXT",
+    "dependents": "TEXT",
+    "phoneservice": "TEXT",
+    "multiplelines": "TEXT",
+    "streamingtv": "TEXT",
+    "streamingmovies": "TEXT",
+    "onlinesecurity": "TEXT",
+    "onlinebackup": "TEXT",
+    "deviceprotection": "TEXT",
+    "techsupport": "TEXT",
+    "internetservice": "TEXT",
+}
+
+# prediction details stored alongside the features
+PREDICTION_COLUMNS = {
+    "PredictionTime": "TIMESTAMP NOT NULL",
+    "ModelUsed": "TEXT NOT NULL",
+    "Prediction": "TEXT NOT NULL",
+    "PredictionProbability": "REAL NOT NULL",
+}
+
+HISTORY_COLUMNS = list(FEATURE_COLUMNS) + list(PREDICTION_COLUMNS)
+
+# lines of a git-lfs pointer file, earlier versions appended their headerless rows to an un-fetched pointer
+LFS_POINTER_PREFIXES = ("version https://git-lfs", "oid sha256:", "size ")
+
+# the background writer flushes once this many predictions are queued,
+# or once the oldest queued prediction has waited FLUSH_INTERVAL seconds
+FLUSH_BATCH_SIZE = 100
+FLUSH_INTERVAL = 2.0
+# predictions kept for another attempt while the database cannot be written, the oldest are dropped beyond this
+MAX_PENDING_ROWS = 10_000
+
+logger = logging.getLogger(__name__)
+
+
+# databases whose table and indexes this process has already created or checked
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+
+def _create_schema(connection, legacy_csv):
+    # the tables, their indexes and the legacy csv import, done once per database and process
+    # WAL is stored in the database file, so readers never block the writers from then on
+    connection.execute("PRAGMA journal_mode=WAL")
+    column_definitions = ", ".join(f'"{name}" {sql_type}' for name, sql_type in {**FEATURE_COLUMNS, **PREDICTION_COLUMNS}.items())
+    with connection:
+        connection.execute(f"CREATE TABLE IF NOT EXISTS prediction_history (id INTEGER PRIMARY KEY, {column_definitions})")
+        # indexes behind the date-range, model filter and sorting of the History page
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_history_time ON prediction_history ("PredictionTime")')
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_history_model_time ON prediction_history ("ModelUsed", "PredictionTime")')
+        # legacy csv files already imported, so each is imported once whenever the database was created
+        connection.execute("CREATE TABLE IF NOT EXISTS legacy_imports (source TEXT PRIMARY KEY, imported_rows INTEGER NOT NULL)")
+    if legacy_csv is not None and os.path.exists(legacy_csv):
+        _import_legacy_csv(connection, legacy_csv)
+
+
+def connect(path=HISTORY_DB, legacy_csv=None):
+    """ Opens the history database, creating the tables the first time this process opens it
+    legacy_csv: csv log of earlier versions imported once into the database, when None
+    LEGACY_HISTORY_CSV for HISTORY_DB and nothing for any other database
+    returns a sqlite3 connection
+    """
+    key = os.path.abspath(path)
+    if legacy_csv is None and key == os.path.abspath(HISTORY_DB):
+        legacy_csv = LEGACY_HISTORY_CSV
+    if not os.path.exists(path):
+        # deleted while the app runs, created again below
+        _schema_ready.discard(key)
+    # wait for other sessions holding the write lock instead of failing straight away
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA synchronous=NORMAL")
+    if key not in _schema_ready:
+        with _schema_lock:
+            if key not in _schema_ready:
+                _create_schema(connection, legacy_csv)
+                _schema_ready.add(key)
+    return connection
+
+
+def read_legacy_csv(path=LEGACY_HISTORY_CSV):
+    """ This function reads the csv log of earlier versions of the app
+    git-lfs pointer lines are ignored, and the rows may come with or without a header
+    returns (dataframe of HISTORY_COLUMNS, number of lines that were not usable predictions)
+    """
+    with open(path, encoding="utf-8", errors="replace") as file:
+        lines = [line for line in file.read().splitlines() if line.strip() and not line.startswith(LFS_POINTER_PREFIXES)]
+    if not lines:
+        return pd.DataFrame(columns=HISTORY_COLUMNS), 0
+    has_header = set(HISTORY_COLUMNS).issubset(lines[0].split(","))
+    legacy = pd.read_csv(io.StringIO("\n".join(lines)), header=0 if has_header else None,
+                         names=None if has_header else HISTORY_COLUMNS, on_bad_lines="skip")
+    legacy = legacy.reindex(columns=HISTORY_COLUMNS)
+    legacy["PredictionTime"] = pd.to_datetime(legacy["PredictionTime"], errors="coerce")
+    legacy["PredictionProbability"] = pd.to_numeric(legacy["PredictionProbability"], errors="coerce")
+    # rows missing a prediction detail cannot go in the table
+    legacy = legacy.dropna(subset=list(PREDICTION_COLUMNS))
+    return legacy, len(lines) - has_header - len(legacy)
+
+
+def _import_legacy_csv(connection, path):
+    source = os.path.normpath(path)
+    if connection.execute("SELECT 1 FROM legacy_imports WHERE source = ?", (source,)).fetchone():
+        return
+    try:
+        legacy, skipped = read_legacy_csv(path)
+    except (OSError, pd.errors.ParserError) as error:
+        logger.warning("Could not import the prediction history in %s: %s", path, error)
+        return
+    if skipped:
+        logger.warning("Skipped %d lines of %s that are not complete predictions", skipped, path)
+    legacy = legacy.assign(PredictionTime=legacy["PredictionTime"].dt.strftime("%Y-%m-%d %H:%M:%S"))
+    # a database written by an earlier version may already hold some of these rows
+    keys = list(PREDICTION_COLUMNS)
+    quoted_keys = ", ".join(f'"{name}"' for name in keys)
+    existing = pd.read_sql_query(f'SELECT {quoted_keys} FROM prediction_history WHERE "PredictionTime" BETWEEN ? AND ?',
+                                 connection, params=[legacy["PredictionTime"].min(), legacy["PredictionTime"].max()])
+    legacy = legacy.merge(existing.drop_duplicates(), on=keys, how="left", indicator=True)
+    legacy = legacy[legacy["_merge"] == "left_only"]
+    if len(legacy):
+        _insert(connection, legacy)
+        logger.info("Imported %d predictions from %s", len(legacy), path)
+    with connection:
+        connection.execute("INSERT INTO legacy_imports (source, imported_rows) VALUES (?, ?)", (source, len(legacy)))
+
+
+def _insert(connection, df):
+    placeholders = ", ".join("?" for _ in HISTORY_COLUMNS)
+    quoted_columns = ", ".join(f'"{name}"' for name in HISTORY_COLUMNS)
+    rows = df[HISTORY_COLUMNS].itertuples(index=False, name=None)
+    # one transaction per batch, sqlite serialises concurrent writers on its own lock
+    with connection:
+        connection.executemany(f"INSERT INTO prediction_history ({quoted_columns}) VALUES ({placeholders})", rows)
+
+
+def append_predictions(df, path=HISTORY_DB):
+    """ This function appends a batch of predictions to the history
+    df: dataframe with the feature columns plus PredictionTime, ModelUsed, Prediction and PredictionProbability
+    """
+    df = df.assign(PredictionTime=pd.to_datetime(df["PredictionTime"]).dt.strftime("%Y-%m-%d %H:%M:%S"))
+    with closing(connect(path)) as connection:
+        _insert(connection, df)
+
+
+def read_history(path=HISTORY_DB):
+    """ Returns the whole prediction history as a dataframe, oldest prediction first """
+    quoted_columns = ", ".join(f'"{name}"' for name in HISTORY_COLUMNS)
+    with closing(connect(path)) as connection:
+        history = pd.read_sql_query(f"SELECT {quoted_columns} FROM prediction_history ORDER BY id", connection)
+    history["PredictionTime"] = pd.to_datetime(history["PredictionTime"])
+    return history
+
+
+def _where_clause(start, end, models):
+    conditions, params = [], []
+    if start is not None:
+        conditions.append('"PredictionTime" >= ?')
+        params.append(pd.Timestamp(start).strftime("%Y-%m-%d %H:%M:%S"))
+    if end is not None:
+        # end is inclusive of the whole day
+        conditions.append('"PredictionTime" < ?')
+        params.append((pd.Timestamp(end).normalize() + pd.Timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S"))
+    if models:
+        conditions.append(f'"ModelUsed" IN ({", ".join("?" for _ in models)})')
+        params.extend(models)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def history_version(path=HISTORY_DB):
+    """ Returns the id of the newest prediction, a cheap key for caching history aggregates """
+    with closing(connect(path)) as connection:
+        return connection.execute("SELECT MAX(id) FROM prediction_history").fetchone()[0] or 0
+
+
+def count_history(start=None, end=None, models=None, path=HISTORY_DB):
+    """ Returns the number of predictions matching the date range (inclusive) and models """
+    where, params = _where_clause(start, end, models)
+    with closing(connect(path)) as connection:
+        return connection.execute(f"SELECT COUNT(*) FROM prediction_history{where}", params).fetchone()[0]
+
+
+def history_summary(path=HISTORY_DB):
+    """ Returns a dataframe with the prediction count and first/last prediction time per model """
+    with closing(connect(path)) as connection:
+        return pd.read_sql_query(
+            'SELECT "ModelUsed", COUNT(*) AS "Predictions", MIN("PredictionTime") AS "FirstPrediction", '
+            'MAX("PredictionTime") AS "LastPrediction" FROM prediction_history GROUP BY "ModelUsed" ORDER BY "ModelUsed"',
+            connection)
+
+
+def query_history(page=1, page_size=50, start=None, end=None, models=None,
+                  sort_by="PredictionTime", descending=True, path=HISTORY_DB):
+    """ This function reads one page of the prediction history
+    page: 1-based page number
+    page_size: rows per page
+    start, end: optional dates bounding PredictionTime (both inclusive)
+    models: optional list of ModelUsed values to keep
+    sort_by: a column of HISTORY_COLUMNS, sorted in the database
+    returns a dataframe with at most page_size rows
+    """
+    if sort_by not in HISTORY_COLUMNS:
+        raise ValueError(f"Cannot sort history by '{sort_by}'")
+    where, params = _where_clause(start, end, models)
+    direction = "DESC" if descending else "ASC"
+    quoted_columns = ", ".join(f'"{name}"' for name in HISTORY_COLUMNS)
+    query = (f'SELECT {quoted_columns} FROM prediction_history{where} '
+             f'ORDER BY "{sort_by}" {direction}, id {direction} LIMIT ? OFFSET ?')
+    with closing(connect(path)) as connection:
+        history = pd.read_sql_query(query, connection, params=params + [page_size, (page - 1) * page_size])
+    history["PredictionTime"] = pd.to_datetime(history["PredictionTime"])
+    return history
+
+
+class _FlushRequest:
+    # queued by HistoryWriter.flush, records whether everything queued before it was written
+    def __init__(self):
+        self.done = threading.Event()
+        self.written = False
+
+
+class HistoryWriter:
+    """ Writes predictions to the history database from a background thread
+    so saving a prediction never waits on the disk
+    """
+    _STOP = object()
+
+    def __init__(self, path=HISTORY_DB, batch_size=FLUSH_BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_pending_rows=MAX_PENDING_ROWS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending_rows = max_pending_rows
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        # write whatever is still queued when the server shuts down
+        atexit.register(self.close)
+
+    def submit(self, predictions):
+        """ Queues a dataframe of predictions, or a single prediction as a dict, returns immediately """
+        if isinstance(predictions, dict):
+            # single predictions are turned into a frame in the background thread, batched together
+            self._queue.put([dict(predictions)])
+        else:
+            self._queue.put(predictions.copy())
+
+    def flush(self, timeout=None):
+        """ Blocks until every prediction submitted so far has been written
+        returns True once they are in the database, False when writing them failed
+        (they stay queued for the next attempt) or timeout seconds passed first
+        """
+        request = _FlushRequest()
+        self._queue.put(request)
+        return request.done.wait(timeout) and request.written
+
+    def close(self):
+        """ Flushes the queue and stops the background thread """
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+    def _write(self, pending):
+        frames = [batch for batch in pending if isinstance(batch, pd.DataFrame)]
+        records = [record for batch in pending if isinstance(batch, list) for record in batch]
+        if records:
+            frames.append(pd.DataFrame.from_records(records))
+        try:
+            append_predictions(pd.concat(frames), path=self.path)
+        except Exception:
+            # keep the batch and try again on the next flush rather than losing it
+            logger.exception("Could not write %d prediction batches to %s", len(pending), self.path)
+            return self._trim(pending)
+        return []
+
+    def _trim(self, pending):
+        # drop the oldest batches once more than max_pending_rows predictions wait for the database
+        pending_rows = sum(len(batch) for batch in pending)
+        dropped = 0
+        while pending and pending_rows > self.max_pending_rows:
+            batch = pending.pop(0)
+            pending_rows -= len(batch)
+            dropped += len(batch)
+        if dropped:
+            logger.error("Dropped the %d oldest predictions, more than %d were waiting to be written to %s",
+                         dropped, self.max_pending_rows, self.path)
+        return pending
+
+    def _run(self):
+        pending = []
+        pending_rows = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, (pd.DataFrame, list)):
+                pending.append(item)
+                pending_rows += len(item)
+                deadline = deadline or time.monotonic() + self.flush_interval
+                if pending_rows < self.batch_size:
+                    continue
+            # size or time threshold reached, or a flush/stop was requested
+            if pending:
+                pending = self._write(pending)
+                pending_rows = sum(len(batch) for batch in pending)
+            deadline = time.monotonic() + self.flush_interval if pending else None
+            if isinstance(item, _FlushRequest):
+                item.written = not pending
+                item.done.set()
+            elif item is self._STOP:
+                return
+
+
+_history_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_history_writer():
+    """ Returns the history writer shared by every session of the process """
+    global _history_writer
+    with _writer_lock:
+        if _history_writer is None:
+            _history_writer = HistoryWriter()
+        return _history_writer
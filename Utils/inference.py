@@ -0,0 +1,99 @@
+import math
+import threading
+import numpy as np
+import pandas as pd
+from Utils.model_registry import load_encoder, load_versioned
+from Utils.compiled_preprocessor import CompiledPreprocessor, is_nan_value, to_float
+from Utils.prediction_cache import prediction_cache
+
+
+class SingleRowPredictor:
+    """ Low-latency scoring of one customer record at a time.
+    The features are written into a preallocated buffer (one per thread) and the
+    estimator runs once, returning the label together with its probability.
+    Pipelines the compiled preprocessor does not support go through the full pipeline instead.
+    With a cache, repeated records are answered from it under (model_key, canonical features).
+    """
+
+    def __init__(self, pipeline, encoder, cache=None, model_key=None):
+        self.pipeline = pipeline
+        self.encoder = encoder
+        self.cache = cache
+        self.model_key = model_key
+        # fused pipelines score a record directly from their tables, without the feature buffer
+        self.record_scorer = getattr(pipeline, "predict_proba_record", None)
+        if self.record_scorer is not None:
+            self.classifier, self.preprocessor = pipeline, pipeline.preprocessor
+        else:
+            self.classifier = pipeline.steps[-1][1]
+            try:
+                self.preprocessor = CompiledPreprocessor(pipeline.named_steps["preprocessor"])
+            except (KeyError, AttributeError, ValueError):
+                self.preprocessor = None
+        self._buffers = threading.local()
+
+    def _buffer(self):
+        if not hasattr(self._buffers, "features"):
+            self._buffers.features = np.zeros((1, self.preprocessor.n_features))
+        return self._buffers.features
+
+    def canonical_features(self, record):
+        """ Returns a hashable form of a record in which equal inputs compare equal
+        (1, 1.0 and "1" for a number, None for a missing number, the one-hot column of a category level
+        or -1 for any level the model does not know)
+        """
+        if self.preprocessor is None:
+            return tuple(sorted((col, None if is_nan_value(value) else str(value)) for col, value in record.items()))
+        numeric = tuple(to_float(record.get(col)) for col in self.preprocessor.numeric_columns)
+        numeric = tuple(None if math.isnan(value) else value for value in numeric)
+        levels = zip(self.preprocessor.categorical_columns, self.preprocessor.categorical_fill, self.preprocessor.level_positions)
+        categorical = tuple(positions.get(fill if is_nan_value(record.get(col)) else record.get(col), -1) for col, fill, positions in levels)
+        return numeric + categorical
+
+    def predict_proba(self, record):
+        """ Returns the class probabilities of one record (dict keyed by feature name) """
+        if self.cache is None:
+            return self._predict_proba(record)
+        key = (self.model_key, self.canonical_features(record))
+        probabilities = self.cache.get(key)
+        if probabilities is None:
+            probabilities = self._predict_proba(record).copy()
+            # shared between sessions, so no caller may change it in place
+            probabilities.setflags(write=False)
+            self.cache.put(key, probabilities)
+        return probabilities
+
+    def _predict_proba(self, record):
+        if self.record_scorer is not None:
+            return self.record_scorer(record)
+        if self.preprocessor is None:
+            return self.pipeline.predict_proba(pd.DataFrame([record]))[0]
+        features = self._buffer()
+        self.preprocessor.transform_record(record, features[0])
+        return self.classifier.predict_proba(features)[0]
+
+    def predict(self, record):
+        """ Returns (decoded label, probability of that label) for one record """
+        probabilities = self.predict_proba(record)
+        best = int(probabilities.argmax())
+        label = self.encoder.classes_[self.classifier.classes_[best]]
+        return label, float(probabilities[best])
+
+
+_predictors = {}
+_lock = threading.Lock()
+
+
+def get_predictor(model_name):
+    """ Returns the shared single-row predictor for a model of the registry,
+    its results are cached in the process-wide prediction_cache
+    """
+    pipeline, version = load_versioned(model_name)
+    encoder = load_encoder()
+    with _lock:
+        cached = _predictors.get(model_name)
+        # rebuilt when the registry hands out a different pipeline or encoder object for the name
+        if cached is None or cached.pipeline is not pipeline or cached.encoder is not encoder:
+            # the artifact version is part of the cache key, a swapped in model never reuses old results
+            cached = _predictors[model_name] = SingleRowPredictor(pipeline, encoder, cache=prediction_cache, model_key=(model_name, version))
+        return cached
@@ -0,0 +1,322 @@
+import os
+import sys
+import time
+import logging
+import threading
+import joblib
+import pandas as pd
+from Utils.preprocessing import NUMERIC_FEATURES, CATEGORY_LEVELS
+from Utils.tree_compiler import compile_tree_pipeline
+from Utils.fused_logistic import fuse_logistic_pipeline
+
+# folder holding the trained pipelines and the label encoder
+MODELS_DIR = "Models/new"
+ENCODER_NAME = "encoder"
+
+# friendly names for the shipped artifacts, in the order they are offered to users
+DISPLAY_NAMES = {
+    "Logistic_reg": "Logistic Regression",
+    "AdaBoost": "AdaBoost",
+    "Decision_tree": "Decision Tree",
+    "XGBoost": "XGBoost",
+    "knn": "KNN",
+}
+
+# artifacts dominated by large numpy arrays (KNN keeps its whole training set) are
+# memory-mapped read-only, so several server processes share them through the page cache
+MMAP_MODELS = {"knn"}
+
+# serving variants built from a shipped artifact when first loaded, only where they are measurably
+# faster than the original (python -m Utils.tree_compiler compares every tree model):
+# display name -> (artifact file name, function turning the loaded pipeline into the variant)
+DERIVED_MODELS = {
+    "Logistic Regression (fused tables)": ("Logistic_reg", fuse_logistic_pipeline),
+    "AdaBoost (compiled trees)": ("AdaBoost", compile_tree_pipeline),
+}
+
+# models preloaded by a lazy warm-up, the rest are loaded the first time they are selected
+FREQUENT_MODELS = {"Logistic_reg", "AdaBoost"}
+
+# seconds between two checks of the models folder for changed artifacts
+WATCH_INTERVAL = 5.0
+# an artifact is only reloaded once it has not been modified for this many seconds,
+# so a file still being copied into the folder is never loaded half-written
+SETTLE_SECONDS = 2.0
+
+logger = logging.getLogger(__name__)
+
+# one loaded instance per artifact path, shared by every page and session of the process
+_loaded_models = {}
+# (modification time, size) of each artifact when it was loaded
+_loaded_versions = {}
+# version of an artifact that failed to reload, not tried again until the file changes once more
+_failed_versions = {}
+_path_locks = {}
+_lock = threading.Lock()
+# one check of the folder at a time, whether from the watcher or a direct call
+_reload_lock = threading.Lock()
+_warm_up_thread = None
+_watcher_thread = None
+
+
+def discover_models(models_dir=MODELS_DIR):
+    """ This function scans the models folder for pipelines
+    models_dir: folder containing the .joblib artifacts
+    returns a dict of display name -> artifact path (the encoder is excluded)
+    """
+    found = {}
+    for file_name in os.listdir(models_dir):
+        stem, extension = os.path.splitext(file_name)
+        if extension != ".joblib" or stem == ENCODER_NAME:
+            continue
+        found[stem] = os.path.join(models_dir, file_name)
+
+    # known models first in their usual order, then anything new that was dropped in the folder
+    ordered = [stem for stem in DISPLAY_NAMES if stem in found]
+    ordered += sorted(stem for stem in found if stem not in DISPLAY_NAMES)
+    return {DISPLAY_NAMES.get(stem, stem.replace("_", " ")): found[stem] for stem in ordered}
+
+
+def _derived_base(name, models_dir=MODELS_DIR):
+    # artifact path and builder of a derived model, None when its artifact is not in the folder
+    stem, build = DERIVED_MODELS[name]
+    path = os.path.join(models_dir, f"{stem}.joblib")
+    return (path, build) if os.path.exists(path) else None
+
+
+def available_models():
+    """ Returns the display names of every pipeline that can be selected, derived variants last """
+    return list(discover_models()) + [name for name in DERIVED_MODELS if _derived_base(name)]
+
+
+def _artifact_version(path):
+    # (modification time, size) identifying the content of an artifact file
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_artifact(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    mmap_mode = "r" if stem in MMAP_MODELS else None
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+def _load_artifact(path):
+    # already loaded models are returned without waiting, even while a new version is being read
+    model = _loaded_models.get(path)
+    if model is not None:
+        return model
+    # a lock per artifact so a slow model loading in the background never blocks the others
+    with _lock:
+        path_lock = _path_locks.setdefault(path, threading.Lock())
+    with path_lock:
+        if path not in _loaded_models:
+            version = _artifact_version(path)
+            model = _read_artifact(path)
+            with _lock:
+                _loaded_models[path], _loaded_versions[path] = model, version
+        return _loaded_models[path]
+
+
+def _load_derived(name):
+    path, build = _derived_base(name)
+    key = (path, name)
+    model = _loaded_models.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        path_lock = _path_locks.setdefault(key, threading.Lock())
+    with path_lock:
+        while key not in _loaded_models:
+            base = _load_artifact(path)
+            model = build(base)
+            with _lock:
+                # a variant of a base that was swapped out while it was built is thrown away and rebuilt
+                if _loaded_models.get(path) is base:
+                    _loaded_models[key], _loaded_versions[key] = model, _loaded_versions[path]
+        return _loaded_models[key]
+
+
+def _model_key(name):
+    # the key a display name is stored under in _loaded_models
+    if name in DERIVED_MODELS and _derived_base(name):
+        return _derived_base(name)[0], name
+    models = discover_models()
+    if name not in models:
+        raise KeyError(f"Unknown model '{name}'. Available models: {', '.join(available_models())}")
+    return models[name]
+
+
+def load_model(name):
+    """ Returns the shared pipeline instance for a display name from available_models() """
+    key = _model_key(name)
+    return _load_derived(name) if isinstance(key, tuple) else _load_artifact(key)
+
+
+def load_versioned(name):
+    """ Returns (pipeline, version) for a display name, read together so that the version
+    always belongs to the pipeline even while a new version of the artifact is swapped in
+    """
+    model = load_model(name)
+    key = _model_key(name)
+    with _lock:
+        if _loaded_models.get(key) is model:
+            return model, _loaded_versions[key]
+    # swapped between the two lookups, the new pipeline is already in place
+    return load_versioned(name)
+
+
+def model_version(name):
+    """ Returns (modification time, size) of the artifact the loaded pipeline for a display name came from """
+    return load_versioned(name)[1]
+
+
+def load_encoder():
+    """ Returns the shared label encoder used to decode the predictions """
+    return _load_artifact(os.path.join(MODELS_DIR, f"{ENCODER_NAME}.joblib"))
+
+
+def is_loaded(name):
+    """ Returns True when the pipeline for a display name is already in memory """
+    try:
+        return _model_key(name) in _loaded_models
+    except KeyError:
+        return False
+
+
+def warm_up(lazy=False, background=False):
+    """ This function loads the encoder and pipelines ahead of the first prediction
+    lazy: only preload FREQUENT_MODELS and leave the rarely used ones until requested
+    background: load in a daemon thread and return it instead of blocking
+    returns a dict of display name -> load time in seconds (or the thread when background)
+    """
+    global _warm_up_thread
+    if background:
+        # every rerun of the calling page asks again, only one warm-up runs at a time
+        with _lock:
+            if _warm_up_thread is None or not _warm_up_thread.is_alive():
+                _warm_up_thread = threading.Thread(target=warm_up, kwargs=dict(lazy=lazy), name="model-warm-up", daemon=True)
+                _warm_up_thread.start()
+            return _warm_up_thread
+
+    timings = {}
+    start = time.perf_counter()
+    load_encoder()
+    timings[ENCODER_NAME] = time.perf_counter() - start
+    for name, path in discover_models().items():
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if lazy and stem not in FREQUENT_MODELS:
+            continue
+        start = time.perf_counter()
+        _load_artifact(path)
+        timings[name] = time.perf_counter() - start
+    if not lazy:
+        for name in DERIVED_MODELS:
+            if _derived_base(name):
+                start = time.perf_counter()
+                _load_derived(name)
+                timings[name] = time.perf_counter() - start
+    return timings
+
+
+def _warm_up_frame():
+    # one made-up customer with the first level of every category
+    row = {col: 0.0 for col in NUMERIC_FEATURES}
+    row.update({col: levels[0] for col, levels in CATEGORY_LEVELS.items()})
+    return pd.DataFrame([row])
+
+
+def _warm_up_model(model):
+    # one prediction before the model is swapped in, so it never serves a request untested
+    # and the lazy initialisation of the estimator happens off the request path
+    if hasattr(model, "predict_proba") and hasattr(model, "feature_names_in_"):
+        model.predict_proba(_warm_up_frame()[list(model.feature_names_in_)])
+
+
+def _reload_artifact(path, version):
+    # load, build the derived variants of and warm up the new version, then swap everything at once
+    model = _read_artifact(path)
+    _warm_up_model(model)
+    with _lock:
+        derived_names = [key[1] for key in _loaded_models if isinstance(key, tuple) and key[0] == path]
+    derived = {}
+    for name in derived_names:
+        derived[(path, name)] = DERIVED_MODELS[name][1](model)
+        _warm_up_model(derived[(path, name)])
+
+    with _lock:
+        # variants built from the old version in the meantime are dropped and rebuilt when next asked for
+        for key in [key for key in _loaded_models if isinstance(key, tuple) and key[0] == path and key not in derived]:
+            del _loaded_models[key]
+        for key, derived_model in derived.items():
+            _loaded_models[key], _loaded_versions[key] = derived_model, version
+        _loaded_models[path], _loaded_versions[path] = model, version
+        _failed_versions.pop(path, None)
+
+
+def reload_changed():
+    """ This function swaps in the artifacts that changed on disk since they were loaded
+    the new version is loaded and warmed up while the old one keeps serving, then replaces it at once;
+    callers already holding the old pipeline finish with it, and it is freed once none does.
+    A version that fails to load, or to rebuild the derived variants in use, is not swapped in.
+    Replace an artifact by moving a new file over it (mv, os.replace) rather than writing into it,
+    a memory-mapped model still in use reads its arrays from the old file.
+    returns the list of artifact paths that were swapped
+    """
+    with _reload_lock:
+        with _lock:
+            loaded = [key for key in _loaded_models if isinstance(key, str)]
+        return [path for path in loaded if _reload_if_changed(path)]
+
+
+def _reload_if_changed(path):
+    # True when a new version of the artifact was swapped in
+    try:
+        version = _artifact_version(path)
+    except FileNotFoundError:
+        # the loaded version keeps serving whoever still uses it, the name is gone from the registry
+        return False
+    if version in (_loaded_versions.get(path), _failed_versions.get(path)):
+        return False
+    if time.time_ns() - version[0] < SETTLE_SECONDS * 1e9:
+        # still being written, picked up by a later check
+        return False
+    try:
+        _reload_artifact(path, version)
+    except Exception:
+        logger.exception("Could not reload %s, the loaded version stays in use", path)
+        _failed_versions[path] = version
+        return False
+    logger.info("Swapped in the new version of %s", path)
+    return True
+
+
+def _watch(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            reload_changed()
+        except Exception:
+            logger.exception("Checking %s for new model versions failed", MODELS_DIR)
+
+
+def start_watcher(interval=WATCH_INTERVAL):
+    """ Starts the daemon thread calling reload_changed every interval seconds,
+    only one runs per process however often it is called
+    returns the thread
+    """
+    global _watcher_thread
+    with _lock:
+        if _watcher_thread is None or not _watcher_thread.is_alive():
+            _watcher_thread = threading.Thread(target=_watch, args=(interval,), name="model-watcher", daemon=True)
+            _watcher_thread.start()
+        return _watcher_thread
+
+
+if __name__ == "__main__":
+    # run before `streamlit run` to pull the artifacts into the OS page cache, which only speeds up the
+    # server's own loading (started in the background by Home, Predict and Bulk Predict), it does not replace it:
+    # python -m Utils.model_registry [--lazy]
+    timings = warm_up(lazy="--lazy" in sys.argv[1:])
+    for name, seconds in timings.items():
+        print(f"{name:<20} loaded in {seconds * 1000:.1f} ms")
@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+# entries kept by the cache shared by the Predict page sessions
+CACHE_SIZE = 10_000
+
+
+class PredictionCache:
+    """ Thread-safe LRU cache of class probabilities.
+    Keys combine the model identity and version with the canonical features of a row,
+    so a retrained model never serves the probabilities of the previous one.
+    """
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Returns the cached probabilities for key, or None on a miss """
+        with self._lock:
+            probabilities = self._entries.get(key)
+            if probabilities is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return probabilities
+
+    def put(self, key, probabilities):
+        """ Stores probabilities, evicting the least recently used entries past max_size """
+        with self._lock:
+            self._entries[key] = probabilities
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """ Returns a dict with the hits, misses, hit rate and current size """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+            }
+
+
+# cache shared by every session of the server process
+prediction_cache = PredictionCache()
@@ -0,0 +1,207 @@
+import sys
+import json
+import queue
+import logging
+import argparse
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+from Utils.model_registry import available_models, load_model, load_encoder, warm_up, start_watcher
+from Utils.preprocessing import SchemaError, resolve_columns, prepare_and_validate
+from Utils.scoring import score_frame
+
+# single-record requests arriving within MAX_WAIT seconds of each other are scored in one call,
+# up to MAX_BATCH_SIZE records per call
+MAX_BATCH_SIZE = 256
+MAX_WAIT = 0.005
+
+# longest a request waits for its micro-batch to be scored
+REQUEST_TIMEOUT = 30.0
+
+# largest request body accepted, in bytes
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+
+logger = logging.getLogger(__name__)
+
+
+def score_records(model_name, records):
+    """ This function scores a list of records with one call to the model
+    model_name: display name from the model registry
+    records: dicts keyed by the canonical feature names (see normalize_record)
+    returns one dict per record, {"prediction", "probability"} or {"error"} for invalid values
+    """
+    valid, invalid = prepare_and_validate(pd.DataFrame.from_records(records))
+    results = [None] * len(records)
+    if len(valid):
+        # the registry is asked on every batch, so a reloaded model is picked up straight away
+        scored = score_frame(load_model(model_name), load_encoder(), valid)
+        for row, label, probability in zip(scored.index, scored["Prediction"], scored["PredictionProbability"]):
+            results[row] = {"prediction": label, "probability": float(probability)}
+    for row, problem in invalid["Problem"].items():
+        results[row] = {"error": problem}
+    return results
+
+
+def normalize_record(record):
+    """ Returns the record with its keys renamed to the canonical feature names
+    raises SchemaError when a feature is missing
+    """
+    if not isinstance(record, dict):
+        raise SchemaError("Every record must be a JSON object")
+    rename = resolve_columns(record)
+    return {rename.get(key, key): value for key, value in record.items()}
+
+
+class MicroBatcher:
+    """ Collects single records submitted by concurrent requests for one model
+    and scores them together in a background thread
+    """
+
+    def __init__(self, model_name, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT):
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"micro-batcher-{model_name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        """ Queues a normalized record and returns a Future resolving to its result dict """
+        future = Future()
+        self._queue.put((record, future))
+        return future
+
+    def _next_batch(self):
+        # block for the first record, then wait at most max_wait for more to arrive
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = score_records(self.model_name, [record for record, _ in batch])
+            except Exception as error:
+                logger.exception("Scoring a batch of %d records failed", len(batch))
+                for _, future in batch:
+                    future.set_exception(error)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+
+
+_batchers = {}
+_lock = threading.Lock()
+
+
+def get_batcher(model_name):
+    """ Returns the shared micro-batcher of a model, started on first use """
+    with _lock:
+        if model_name not in _batchers:
+            _batchers[model_name] = MicroBatcher(model_name, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT)
+        return _batchers[model_name]
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """ JSON endpoints:
+    GET  /health   -> {"status": "ok"}
+    GET  /models   -> {"models": [...]}
+    POST /predict  {"model": name, "record": {...}}    -> {"prediction", "probability"}
+    POST /predict  {"model": name, "records": [{...}]} -> {"predictions": [...]}
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/models":
+            self._send_json(200, {"models": available_models()})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self._send_json(413, {"error": "Request body too large"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length))
+            model_name = payload.get("model")
+            if model_name not in available_models():
+                raise SchemaError(f"Unknown model '{model_name}'. Available models: {', '.join(available_models())}")
+            if "records" in payload:
+                records = [normalize_record(record) for record in payload["records"]]
+            else:
+                record = normalize_record(payload.get("record"))
+        except (ValueError, AttributeError, TypeError) as error:
+            # json errors and SchemaError are both ValueErrors
+            self._send_json(400, {"error": str(error)})
+            return
+
+        try:
+            if "records" in payload:
+                # already a batch, scored straight away in this request's thread
+                self._send_json(200, {"predictions": score_records(model_name, records) if records else []})
+            else:
+                self._send_json(200, get_batcher(model_name).submit(record).result(timeout=REQUEST_TIMEOUT))
+        except Exception as error:
+            logger.exception("Prediction request failed")
+            self._send_json(500, {"error": str(error)})
+
+    def log_message(self, format, *args):
+        # one line per request would dominate the cost of a single prediction
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """ Loads every model and serves predictions until interrupted,
+    new versions of the artifacts are swapped in while serving
+    """
+    warm_up()
+    start_watcher()
+    server = ThreadingHTTPServer((host, port), PredictionHandler)
+    server.daemon_threads = True
+    print(f"serving churn predictions on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    # python -m Utils.prediction_service [--host 127.0.0.1] [--port 8502]
+    parser = argparse.ArgumentParser(prog="python -m Utils.prediction_service", description="Local HTTP/JSON churn scoring service.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE, help="most records scored in one model call")
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT * 1000, help="how long a batch waits for more records")
+    args = parser.parse_args()
+    MAX_BATCH_SIZE, MAX_WAIT = args.max_batch_size, args.max_wait_ms / 1000
+    sys.exit(serve(args.host, args.port))
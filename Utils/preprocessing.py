@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+# Yes/No service columns whose extra levels are collapsed before scoring
+MAPPED_COLUMNS = [
+    "partner", "dependents", "phoneservice", "multiplelines", "onlinesecurity", "onlinebackup",
+    "deviceprotection", "techsupport", "streamingtv", "streamingmovies", "paperlessbilling",
+]
+VALUE_MAPPING = {True: "Yes", False: "No", "No internet service": "No", "No phone service": "No"}
+
+# the models take seniorcitizen as a 0/1 number
+SENIOR_CITIZEN_MAPPING = {"Yes": 1, "No": 0, "1": 1, "0": 0}
+
+TARGET_COLUMN = "churn"
+
+# features every pipeline in Models/new was trained on
+NUMERIC_FEATURES = ["seniorcitizen", "tenure", "monthlycharges", "totalcharges"]
+CATEGORY_LEVELS = {
+    "gender": ["Female", "Male"],
+    "partner": ["No", "Yes"],
+    "dependents": ["No", "Yes"],
+    "phoneservice": ["No", "Yes"],
+    "multiplelines": ["No", "Yes"],
+    "internetservice": ["DSL", "Fiber optic", "No"],
+    "onlinesecurity": ["No", "Yes"],
+    "onlinebackup": ["No", "Yes"],
+    "deviceprotection": ["No", "Yes"],
+    "techsupport": ["No", "Yes"],
+    "streamingtv": ["No", "Yes"],
+    "streamingmovies": ["No", "Yes"],
+    "contract": ["Month-to-month", "One year", "Two year"],
+    "paperlessbilling": ["No", "Yes"],
+    "paymentmethod": ["Bank transfer (automatic)", "Credit card (automatic)", "Electronic check", "Mailed check"],
+}
+FEATURE_COLUMNS = NUMERIC_FEATURES + list(CATEGORY_LEVELS)
+
+# extra spellings of column names that do not reduce to the feature name on their own
+COLUMN_ALIASES = {
+    "senior": "seniorcitizen",
+    "monthlycharge": "monthlycharges",
+    "totalcharge": "totalcharges",
+}
+
+
+class SchemaError(ValueError):
+    """ Raised when uploaded data cannot be matched to the model features """
+
+
+class RejectedRows:
+    """ Counts rows that failed validation and keeps the first few of them for display """
+
+    def __init__(self, keep=100):
+        self.keep = keep
+        self.count = 0
+        self._kept = []
+
+    def add(self, rows):
+        self.count += len(rows)
+        kept = sum(len(part) for part in self._kept)
+        if kept < self.keep and len(rows):
+            self._kept.append(rows.head(self.keep - kept))
+
+    @property
+    def rows(self):
+        return pd.concat(self._kept) if self._kept else pd.DataFrame()
+
+
+def remap_values(series, mapping):
+    """ This function maps the values of a series through a lookup table
+    only the distinct values are looked up, the rows are rebuilt from their integer codes,
+    categorical series stay categorical and values missing from mapping are kept as they are
+    returns the mapped series
+    """
+    is_categorical = isinstance(series.dtype, pd.CategoricalDtype)
+    if is_categorical:
+        codes, levels = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, levels = pd.factorize(series)
+    mapped_levels = pd.Index([mapping.get(level, level) for level in levels], dtype=object)
+    new_levels = mapped_levels.unique()
+    # old code -> new code, missing values keep the -1 code
+    lookup = np.append(new_levels.get_indexer(mapped_levels), -1)
+    new_codes = lookup[codes]
+    if is_categorical:
+        values = pd.Categorical.from_codes(new_codes, new_levels)
+    else:
+        values = np.append(new_levels.to_numpy(), np.nan)[new_codes]
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def values_mapper(df, columns):
+    """ This function takes two parameters and map the values in the column
+    df: dataframe object
+    columns: columns in the dataframe that you want to map the values
+    returns a new dataframe, df itself is not modified
+    """
+    return df.assign(**{col: remap_values(df[col], VALUE_MAPPING) for col in columns})
+
+
+def prepare_features(df):
+    """ This function turns raw customer data into the model input
+    drops the churn label, collapses the service levels to Yes/No, makes the charges and tenure
+    numeric and seniorcitizen a 0/1 number, expects the canonical lowercase column names
+    returns a new dataframe
+    """
+    df = values_mapper(df.drop(columns=TARGET_COLUMN, errors="ignore"), [col for col in MAPPED_COLUMNS if col in df.columns])
+    for column in ["tenure", "monthlycharges", "totalcharges"]:
+        if column in df.columns and not pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+    if "seniorcitizen" in df.columns and not pd.api.types.is_numeric_dtype(df["seniorcitizen"]):
+        df["seniorcitizen"] = pd.to_numeric(remap_values(df["seniorcitizen"].astype(str), SENIOR_CITIZEN_MAPPING), errors="coerce")
+    return df
+
+
+def _normalize_name(name):
+    # "Paperless Billing", "paperless_billing" and "PaperlessBilling" all become "paperlessbilling"
+    key = "".join(char for char in str(name).lower() if char.isalnum())
+    return COLUMN_ALIASES.get(key, key)
+
+
+def resolve_columns(columns):
+    """ This function maps column names to the canonical lowercase feature names
+    columns: column names as found in the data
+    returns a rename dict for the columns matching a feature or churn, other columns are left out
+    raises SchemaError when a feature is missing or matched by more than one column
+    """
+    known = set(FEATURE_COLUMNS) | {TARGET_COLUMN}
+    rename = {}
+    for column in columns:
+        canonical = _normalize_name(column)
+        if canonical in known:
+            if canonical in rename.values():
+                raise SchemaError(f"More than one column matches '{canonical}'")
+            rename[column] = canonical
+    missing = [feature for feature in FEATURE_COLUMNS if feature not in rename.values()]
+    if missing:
+        raise SchemaError(f"Missing columns: {', '.join(missing)}")
+    return rename
+
+
+def _is_missing(values):
+    missing = values.isna()
+    if values.dtype == object:
+        missing |= values.astype(str).str.strip().eq("")
+    return missing
+
+
+def find_invalid_rows(raw, prepared):
+    """ This function checks every feature of a batch at once
+    raw: data with canonical column names, before prepare_features
+    prepared: the same rows after prepare_features
+    returns a series with the problems found in each row, empty for valid rows
+    """
+    problems = pd.Series("", index=prepared.index, dtype=object)
+    for column in NUMERIC_FEATURES:
+        # a value that was given but could not be read as a number
+        unreadable = ~_is_missing(raw[column]) & prepared[column].isna()
+        negative = prepared[column] < 0
+        problems[unreadable] += f"{column} is not a number; "
+        problems[negative] += f"{column} is negative; "
+    for column, levels in CATEGORY_LEVELS.items():
+        unknown = prepared[column].notna() & ~prepared[column].isin(levels)
+        problems[unknown] += f"unknown {column}; "
+    return problems.str.rstrip("; ")
+
+
+def prepare_and_validate(df):
+    """ This function resolves the column names, prepares the features and checks the values
+    missing values are allowed, the pipelines impute them
+    returns (prepared valid rows, raw invalid rows with a Problem column)
+    """
+    raw = df.rename(columns=resolve_columns(df.columns))
+    prepared = prepare_features(raw)
+    problems = find_invalid_rows(raw, prepared)
+    invalid = problems.ne("")
+    return prepared[~invalid], raw[invalid].assign(Problem=problems[invalid])
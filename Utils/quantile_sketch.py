@@ -0,0 +1,104 @@
+import math
+import numpy as np
+
+# largest relative error of a quantile returned by the sketch, 0.5% of the true value
+RELATIVE_ACCURACY = 0.005
+
+
+class QuantileSketch:
+    """ Streaming summary of a numeric column that answers quantiles without keeping the values.
+    Every value is counted in a logarithmic bucket whose width grows with the value, so the
+    number of buckets depends on the range of the data rather than on the number of rows and
+    any quantile is known within RELATIVE_ACCURACY of its true value.
+    The exact count, sum, minimum and maximum are kept alongside the buckets.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # bucket index -> count, for the values above zero and the absolute values below zero
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        # bucket values of a column holding only whole numbers are rounded to whole numbers
+        self.integers = True
+
+    def _add_buckets(self, buckets, values):
+        indexes, counts = np.unique(np.ceil(np.log(values) / self.log_gamma).astype(np.int64), return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            buckets[index] = buckets.get(index, 0) + count
+
+    def update(self, values):
+        """ Adds the values of an array or series to the sketch, missing values are skipped """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.integers = self.integers and bool(np.all(values == np.round(values)))
+        self._add_buckets(self.positive, values[values > 0])
+        self._add_buckets(self.negative, -values[values < 0])
+        self.zeros += int((values == 0).sum())
+
+    def _bucket_value(self, index):
+        # the value of a bucket closest, relatively, to every value it may contain
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def buckets(self):
+        """ Returns (values, counts) of every bucket in increasing order of value """
+        negative = sorted(self.negative, reverse=True)
+        positive = sorted(self.positive)
+        values = [-self._bucket_value(index) for index in negative] + [0.0] * bool(self.zeros) + [self._bucket_value(index) for index in positive]
+        counts = [self.negative[index] for index in negative] + [self.zeros] * bool(self.zeros) + [self.positive[index] for index in positive]
+        # the exact extremes stand in for the approximate edge buckets
+        values = np.clip(np.array(values), self.min, self.max)
+        return np.round(values) if self.integers else values, np.array(counts)
+
+    def bucket_ranges(self):
+        """ Returns (lower, upper, counts) of every bucket in increasing order of value,
+        the range of values each bucket may contain within the minimum and maximum
+        """
+        negative = sorted(self.negative, reverse=True)
+        positive = sorted(self.positive)
+        lower = [-self.gamma ** index for index in negative] + [0.0] * bool(self.zeros) + [self.gamma ** (index - 1) for index in positive]
+        upper = [-self.gamma ** (index - 1) for index in negative] + [0.0] * bool(self.zeros) + [self.gamma ** index for index in positive]
+        counts = [self.negative[index] for index in negative] + [self.zeros] * bool(self.zeros) + [self.positive[index] for index in positive]
+        return np.clip(np.array(lower), self.min, self.max), np.clip(np.array(upper), self.min, self.max), np.array(counts)
+
+    def histogram(self, bins):
+        """ Returns (counts, edges) like np.histogram of the values, with equal-width bins
+        from the minimum to the maximum and the count of every bucket spread evenly over its range
+        """
+        if not self.count:
+            return np.histogram([], bins=bins)
+        edges = np.linspace(self.min, self.max, bins + 1)
+        values, _ = self.buckets()
+        lower, upper, counts = self.bucket_ranges()
+        width = upper - lower
+        # buckets that can only hold one value (always the case for small whole numbers) stay at that value
+        single = (width == 0) | (self.integers & (np.floor(upper) - np.ceil(lower) < 1))
+        spread = np.clip((edges[:, None] - lower) / np.where(single, 1, width), 0, 1)
+        # share of every bucket below every edge, like np.histogram a value on an edge counts in the bin above it
+        below = np.where(single, edges[:, None] > values, spread)
+        cumulative = np.round(below @ counts)
+        cumulative[-1] = self.count
+        return np.diff(cumulative).astype(int), edges
+
+    def quantiles(self, qs):
+        """ Returns the values at the given quantiles (between 0 and 1), nan when the sketch is empty """
+        if not self.count:
+            return [math.nan] * len(qs)
+        values, counts = self.buckets()
+        cumulative = np.cumsum(counts)
+        ranks = np.asarray(qs) * (self.count - 1)
+        return values[np.searchsorted(cumulative, ranks, side="right")].tolist()
+
+    def mean(self):
+        return self.sum / self.count if self.count else math.nan
@@ -0,0 +1,221 @@
+import os
+import time
+import datetime
+import tempfile
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from Utils.model_registry import load_model, load_encoder
+from Utils.prediction_cache import PredictionCache
+
+# rows sent through the pipeline per call, bounds the size of the intermediate feature matrices
+CHUNK_SIZE = 50_000
+
+# scored csv kept in memory up to this size before the temporary file spills to disk
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+# rows of the scored data kept in memory to show on the page
+PREVIEW_ROWS = 100
+
+# below this many rows starting worker processes costs more than it saves
+PARALLEL_MIN_ROWS = 200_000
+
+# distinct rows remembered across the chunks of one scoring run
+RUN_CACHE_SIZE = 100_000
+
+# scored files of the Bulk Predict page, kept on disk while a session shows them
+SCORED_FILES_DIR = os.path.join(tempfile.gettempdir(), "churn_bulk_predictions")
+# a scored file no session has shown for this many seconds is deleted, e.g. after the session ended or the server restarted
+SCORED_FILE_MAX_AGE = 60 * 60
+
+# pipeline, encoder and run cache of a scoring worker process, set up once by _init_worker
+_worker_model = None
+
+
+def predict_proba_unique(pipeline, df, cache=None):
+    """ This function runs predict_proba on the distinct feature rows of df only
+    rows are matched on a hash of the model features, so extra columns such as an id do not count
+    cache: optional PredictionCache keyed on those row hashes, must only ever hold results of this pipeline
+    returns the probabilities of every row of df, in order
+    """
+    features = df[list(pipeline.feature_names_in_)] if hasattr(pipeline, "feature_names_in_") else df
+    row_hashes = pd.util.hash_pandas_object(features, index=False).to_numpy()
+    unique_hashes, first_rows, inverse = np.unique(row_hashes, return_index=True, return_inverse=True)
+    if cache is None and len(unique_hashes) == len(df):
+        return pipeline.predict_proba(features)
+
+    keys = unique_hashes.tolist()
+    found = [cache.get(key) for key in keys] if cache is not None else [None] * len(keys)
+    missing = [i for i, probabilities in enumerate(found) if probabilities is None]
+    if missing:
+        for i, probabilities in zip(missing, pipeline.predict_proba(features.iloc[first_rows[missing]])):
+            found[i] = probabilities
+            if cache is not None:
+                cache.put(keys[i], probabilities)
+    return np.vstack(found)[inverse]
+
+
+def score_frame(pipeline, encoder, df, prediction_time=None, cache=None):
+    """ This function scores a dataframe with a single pass through the pipeline
+    pipeline: fitted sklearn pipeline exposing predict_proba
+    encoder: label encoder used to decode the predicted classes
+    df: dataframe with the model features, duplicated rows are scored once
+    cache: optional PredictionCache shared by the chunks of a run, see predict_proba_unique
+    returns a copy of df with PredictionTime, Prediction and PredictionProbability columns
+    """
+    probabilities = predict_proba_unique(pipeline, df, cache=cache)
+    # the predicted class is the most probable one, so predict() never has to run
+    best = probabilities.argmax(axis=1)
+    encoded_labels = pipeline.classes_[best]
+    return df.assign(
+        PredictionTime=prediction_time or datetime.date.today(),
+        Prediction=encoder.classes_[encoded_labels],
+        PredictionProbability=probabilities[np.arange(len(best)), best],
+    )
+
+
+def iter_chunks(df, chunk_size=CHUNK_SIZE):
+    """ Splits a dataframe into consecutive row slices of at most chunk_size rows """
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def score_in_chunks(pipeline, encoder, data, chunk_size=CHUNK_SIZE):
+    """ This function scores data chunk by chunk
+    data: a dataframe, or an iterable of dataframes such as pd.read_csv(..., chunksize=n)
+    rows repeated anywhere in the data are only run through the pipeline once
+    yields one scored dataframe per chunk, in input order
+    """
+    chunks = iter_chunks(data, chunk_size) if isinstance(data, pd.DataFrame) else data
+    # every chunk of a run gets the same timestamp even if scoring crosses midnight
+    prediction_time = datetime.date.today()
+    cache = PredictionCache(max_size=RUN_CACHE_SIZE)
+    for chunk in chunks:
+        if len(chunk):
+            yield score_frame(pipeline, encoder, chunk, prediction_time=prediction_time, cache=cache)
+
+
+def read_csv_chunks(source, chunk_size=CHUNK_SIZE):
+    """ Returns a reader yielding the csv at source (path or file object) chunk_size rows at a time """
+    return pd.read_csv(source, chunksize=chunk_size)
+
+
+def write_scored_csv(scored_chunks, preview_rows=PREVIEW_ROWS, path=None):
+    """ This function streams scored chunks into a csv file
+    scored_chunks: iterable of scored dataframes, e.g. from score_in_chunks
+    preview_rows: number of leading rows kept in memory for display
+    path: file to write, a spooled temporary file (in memory up to SPOOL_MAX_SIZE) when None
+    returns (file rewound to the start, preview dataframe, total row count)
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode="w+b") if path is None else open(path, "w+b")
+    previews = []
+    preview_count = 0
+    row_count = 0
+    for chunk in scored_chunks:
+        # only the header of the first chunk is written
+        output.write(chunk.to_csv(header=row_count == 0, index=False).encode("utf-8"))
+        if preview_count < preview_rows:
+            previews.append(chunk.head(preview_rows - preview_count))
+            preview_count += len(previews[-1])
+        row_count += len(chunk)
+    output.seek(0)
+    preview = pd.concat(previews) if previews else pd.DataFrame()
+    return output, preview, row_count
+
+
+def new_scored_file():
+    """ Returns the path of a new empty file in SCORED_FILES_DIR for a scored upload """
+    os.makedirs(SCORED_FILES_DIR, exist_ok=True)
+    handle, path = tempfile.mkstemp(prefix="bulk_prediction_", suffix=".csv", dir=SCORED_FILES_DIR)
+    os.close(handle)
+    return path
+
+
+def touch_scored_file(path):
+    """ Marks a scored file as in use, returns False when it is gone (deleted as stale) """
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def remove_scored_file(path):
+    """ Deletes a scored file that is no longer shown """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_stale_scored_files(max_age=SCORED_FILE_MAX_AGE):
+    """ This function deletes the scored files that no session has used for max_age seconds
+    the age is taken from the modification time, which touch_scored_file moves forward on every use,
+    so files left by ended sessions or by an earlier run of the server are found as well
+    returns the number of files deleted
+    """
+    if not os.path.isdir(SCORED_FILES_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(SCORED_FILES_DIR):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            # removed by another session in the meantime
+            pass
+    return removed
+
+
+def _init_worker(model_name):
+    global _worker_model
+    _worker_model = (load_model(model_name), load_encoder(), PredictionCache(max_size=RUN_CACHE_SIZE))
+
+
+def _score_shard(shard, prediction_time):
+    pipeline, encoder, cache = _worker_model
+    return score_frame(pipeline, encoder, shard, prediction_time=prediction_time, cache=cache)
+
+
+def score_parallel(model_name, data, workers=None, min_rows=PARALLEL_MIN_ROWS, chunk_size=CHUNK_SIZE):
+    """ This function scores data across a pool of worker processes
+    model_name: display name from the model registry, each worker loads it once at start-up
+    data: a dataframe, or an iterable of dataframes such as pd.read_csv(..., chunksize=n)
+    workers: number of worker processes, defaults to the number of CPU cores
+    min_rows: inputs with fewer rows are scored in this process, where the pool would only add overhead
+    yields one scored dataframe per chunk, in input order
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = iter_chunks(data, chunk_size) if isinstance(data, pd.DataFrame) else iter(data)
+
+    # buffer chunks until the input is known to be big enough for the pool
+    buffered = []
+    buffered_rows = 0
+    for chunk in chunks:
+        buffered.append(chunk)
+        buffered_rows += len(chunk)
+        if buffered_rows >= min_rows:
+            break
+    if workers <= 1 or buffered_rows < min_rows:
+        yield from score_in_chunks(load_model(model_name), load_encoder(), itertools.chain(buffered, chunks))
+        return
+
+    prediction_time = datetime.date.today()
+    # spawned workers do not inherit the locks and threads of the server process
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(model_name,)) as executor:
+        # keep a bounded number of shards in flight so a huge input is never fully buffered
+        pending = deque()
+        for chunk in itertools.chain(buffered, chunks):
+            if len(chunk):
+                pending.append(executor.submit(_score_shard, chunk, prediction_time))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,264 @@
+import json
+import time
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import AdaBoostClassifier
+
+# rows evaluated together, bounds the (rows x trees) index arrays of the level-by-level walk
+BLOCK_ROWS = 4096
+
+# largest difference in probability accepted between a compiled model and the original
+PARITY_TOLERANCE = 1e-6
+PARITY_ROWS = 2000
+
+
+class CompiledTrees:
+    """ Every tree of a model flattened into one set of node arrays.
+    Node ids are global, the root of tree t is roots[t] and leaves point back to themselves,
+    so a whole batch walks all trees one level at a time with plain array indexing.
+    """
+
+    def __init__(self, trees, strict):
+        """ trees: dicts of per-node lists (feature, threshold, left, right, default_left, value),
+        left is -1 for a leaf, children are local to their tree
+        strict: True when a sample goes left on x < threshold (xgboost), False for x <= threshold (sklearn)
+        """
+        offsets = np.cumsum([0] + [len(tree["left"]) for tree in trees])
+        self.roots = offsets[:-1].astype(np.intp)
+        self.strict = strict
+        self.feature, self.threshold, self.left, self.right, self.default_left, self.value = [], [], [], [], [], []
+        self.max_depth = 0
+        for offset, tree in zip(offsets, trees):
+            left, right = np.asarray(tree["left"]), np.asarray(tree["right"])
+            is_leaf = left == -1
+            own_ids = offset + np.arange(len(left))
+            self.feature.append(np.where(is_leaf, 0, tree["feature"]))
+            self.threshold.append(np.asarray(tree["threshold"]))
+            self.left.append(np.where(is_leaf, own_ids, offset + left))
+            self.right.append(np.where(is_leaf, own_ids, offset + right))
+            self.default_left.append(np.asarray(tree["default_left"], dtype=bool))
+            self.value.append(np.asarray(tree["value"], dtype=np.float64).reshape(len(left), -1))
+            self.max_depth = max(self.max_depth, _depth(left, right))
+        self.feature = np.concatenate(self.feature).astype(np.intp)
+        self.threshold = _float32_thresholds(np.concatenate(self.threshold), strict)
+        self.left = np.concatenate(self.left).astype(np.intp)
+        self.right = np.concatenate(self.right).astype(np.intp)
+        self.default_left = np.concatenate(self.default_left)
+        # one contiguous row of node values per output, summing them over trees is then a fast row reduction
+        self.value = np.ascontiguousarray(np.concatenate(self.value).T)
+        self.is_leaf = self.left == np.arange(len(self.left))
+        # child of node i is children[2 * i + goes_right]
+        self.children = np.stack([self.left, self.right], axis=1).ravel()
+
+    def leaves(self, X):
+        """ Returns the leaf reached in every tree by every row of X (float32), shape (rows, trees) """
+        n_rows, n_features = X.shape
+        n_trees = len(self.roots)
+        flat_X = X.ravel()
+        # one entry per (row, tree) pair still walking down, dropped once it reaches a leaf
+        node = np.tile(self.roots, n_rows)
+        row_start = np.repeat(np.arange(n_rows) * n_features, n_trees)
+        pair = np.arange(n_rows * n_trees)
+        leaves = node.copy()
+        has_missing = np.isnan(X).any()
+        for _ in range(self.max_depth):
+            x = flat_X[row_start + self.feature[node]]
+            threshold = self.threshold[node]
+            goes_right = ~(x < threshold) if self.strict else ~(x <= threshold)
+            if has_missing:
+                # missing values follow the default branch of the node
+                goes_right = np.where(np.isnan(x), ~self.default_left[node], goes_right)
+            node = self.children[2 * node + goes_right]
+            done = self.is_leaf[node]
+            if done.any():
+                leaves[pair[done]] = node[done]
+                walking = ~done
+                node, row_start, pair = node[walking], row_start[walking], pair[walking]
+                if not len(node):
+                    break
+        return leaves.reshape(n_rows, n_trees)
+
+    def sum_values(self, X):
+        """ Returns the leaf values summed over all trees for every row of X, shape (rows, outputs) """
+        leaves = self.leaves(X)
+        return np.column_stack([output[leaves].sum(axis=1) for output in self.value])
+
+
+def _float32_thresholds(threshold, strict):
+    # xgboost stores float32 thresholds, sklearn compares float32 features with float64 thresholds:
+    # the largest float32 not above a float64 threshold t gives x <= t exactly for every float32 x
+    rounded = threshold.astype(np.float32)
+    if not strict:
+        rounded = np.where(rounded.astype(np.float64) > threshold, np.nextafter(rounded, np.float32(-np.inf)), rounded)
+    return rounded
+
+
+def _depth(left, right):
+    depth = np.zeros(len(left), dtype=int)
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def _sklearn_tree(estimator, leaf_value):
+    # nodes of a fitted sklearn decision tree, leaf_value maps the class probabilities of every node to its output
+    tree = estimator.tree_
+    proba = tree.value[:, 0, :]
+    normalizer = proba.sum(axis=1, keepdims=True)
+    proba = proba / np.where(normalizer == 0, 1, normalizer)
+    return {
+        "feature": tree.feature,
+        "threshold": tree.threshold,
+        "left": tree.children_left,
+        "right": tree.children_right,
+        "default_left": np.zeros(tree.node_count, dtype=bool),
+        "value": leaf_value(proba),
+    }
+
+
+def _softmax(x):
+    x = np.exp(x - x.max(axis=1, keepdims=True))
+    return x / x.sum(axis=1, keepdims=True)
+
+
+class CompiledTreeClassifier:
+    """ Stand-in for a fitted DecisionTree, AdaBoost or XGBoost classifier that evaluates
+    its trees from CompiledTrees arrays, the last step of a compiled pipeline
+    """
+
+    def __init__(self, classifier):
+        self.classes_ = classifier.classes_
+        self.n_features_in_ = classifier.n_features_in_
+        self.n_classes = len(self.classes_)
+        if isinstance(classifier, DecisionTreeClassifier):
+            self.kind = "tree"
+            self.trees = CompiledTrees([_sklearn_tree(classifier, lambda proba: proba)], strict=False)
+        elif isinstance(classifier, AdaBoostClassifier):
+            self._compile_adaboost(classifier)
+        elif hasattr(classifier, "get_booster"):
+            self._compile_xgboost(classifier)
+        else:
+            raise TypeError(f"Cannot compile a {type(classifier).__name__}")
+
+    def _compile_adaboost(self, classifier):
+        self.kind = "adaboost"
+        n_classes = self.n_classes
+        weights = classifier.estimator_weights_[:len(classifier.estimators_)]
+        self.weight_sum = weights.sum()
+        trees = []
+        for estimator, weight in zip(classifier.estimators_, weights):
+            if classifier.algorithm == "SAMME.R":
+                # the SAMME.R term of a leaf only depends on the class probabilities of that leaf
+                def leaf_value(proba):
+                    log_proba = np.log(np.clip(proba, np.finfo(proba.dtype).eps, None))
+                    return (n_classes - 1) * (log_proba - log_proba.mean(axis=1, keepdims=True))
+            else:
+                def leaf_value(proba, weight=weight):
+                    votes = np.eye(n_classes, dtype=bool)[proba.argmax(axis=1)]
+                    return np.where(votes, weight, -weight / (n_classes - 1))
+            trees.append(_sklearn_tree(estimator, leaf_value))
+        self.trees = CompiledTrees(trees, strict=False)
+
+    def _compile_xgboost(self, classifier):
+        self.kind = "xgboost"
+        learner = json.loads(classifier.get_booster().save_raw(raw_format="json"))["learner"]
+        if learner["objective"]["name"] != "binary:logistic" or learner["gradient_booster"]["name"] != "gbtree":
+            raise ValueError("Only binary:logistic gbtree boosters can be compiled")
+        trees = learner["gradient_booster"]["model"]["trees"]
+        try:
+            # boosters trained with early stopping predict with the trees up to the best iteration
+            trees = trees[:classifier.best_iteration + 1]
+        except AttributeError:
+            pass
+        base_score = float(learner["learner_model_param"]["base_score"])
+        self.base_margin = np.log(base_score / (1 - base_score))
+        self.trees = CompiledTrees([{
+            "feature": tree["split_indices"],
+            "threshold": tree["split_conditions"],
+            "left": tree["left_children"],
+            "right": tree["right_children"],
+            "default_left": tree["default_left"],
+            # the split condition of a leaf holds its weight
+            "value": np.where(np.asarray(tree["left_children"]) == -1, tree["split_conditions"], 0.0),
+        } for tree in trees], strict=True)
+
+    def _proba_from_sums(self, sums):
+        if self.kind == "tree":
+            return sums
+        if self.kind == "xgboost":
+            positive = 1 / (1 + np.exp(-(sums[:, 0] + self.base_margin)))
+            return np.column_stack([1 - positive, positive])
+        # AdaBoostClassifier.decision_function followed by predict_proba
+        decision = sums / self.weight_sum
+        if self.n_classes == 2:
+            margin = decision[:, 1] - decision[:, 0]
+            decision = np.column_stack([-margin, margin]) / 2
+        else:
+            decision = decision / (self.n_classes - 1)
+        return _softmax(decision)
+
+    def predict_proba(self, X):
+        """ Returns the class probabilities of the transformed feature matrix X """
+        # both libraries compare float32 features with the split thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if not len(X):
+            return self._proba_from_sums(np.empty((0, len(self.trees.value))))
+        sums = np.vstack([self.trees.sum_values(X[start:start + BLOCK_ROWS]) for start in range(0, len(X), BLOCK_ROWS)])
+        return self._proba_from_sums(sums)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def parity_sample(classifier, trees, n_rows=PARITY_ROWS, random_state=0):
+    """ This function builds feature rows for a parity check
+    a mix of 0/1 one-hot values and continuous values, where some rows sit exactly on split thresholds
+    so the <= / < comparison of the original library is checked as well
+    returns a float array of shape (n_rows, n_features)
+    """
+    rng = np.random.default_rng(random_state)
+    n_features = classifier.n_features_in_
+    X = np.where(rng.random((n_rows, n_features)) < 0.5, rng.integers(0, 2, (n_rows, n_features)), rng.normal(0, 2, (n_rows, n_features)))
+    splits = np.flatnonzero(trees.left != np.arange(len(trees.left)))
+    nodes = rng.choice(splits, size=n_rows // 4)
+    X[np.arange(len(nodes)), trees.feature[nodes]] = trees.threshold[nodes]
+    return X.astype(np.float32)
+
+
+def check_parity(classifier, compiled, X):
+    """ Returns the largest difference between the probabilities of the original and the compiled classifier on X """
+    return float(np.abs(classifier.predict_proba(X) - compiled.predict_proba(X)).max())
+
+
+def compile_tree_pipeline(pipeline, tolerance=PARITY_TOLERANCE):
+    """ This function replaces the tree model at the end of a pipeline with its compiled form
+    the compiled classifier is only returned after it matched the original on a parity sample
+    pipeline: fitted pipeline ending with a DecisionTree, AdaBoost or XGBoost classifier
+    returns a new pipeline sharing the preprocessor of pipeline
+    raises ValueError when the compiled probabilities differ from the original by more than tolerance
+    """
+    name, classifier = pipeline.steps[-1]
+    compiled = CompiledTreeClassifier(classifier)
+    difference = check_parity(classifier, compiled, parity_sample(classifier, compiled.trees))
+    if difference > tolerance:
+        raise ValueError(f"Compiled {type(classifier).__name__} differs from the original by {difference:.2e}")
+    return Pipeline(pipeline.steps[:-1] + [(name, compiled)])
+
+
+if __name__ == "__main__":
+    # python -m Utils.tree_compiler: parity and speed of every tree model compiled, on the deployment data
+    from Utils.model_registry import DISPLAY_NAMES, load_model
+    from Utils.data_loader import load_rows
+    rows = load_rows()
+    for stem in ("AdaBoost", "Decision_tree", "XGBoost"):
+        original = load_model(DISPLAY_NAMES[stem])
+        results = []
+        for model in (original, compile_tree_pipeline(original)):
+            start = time.perf_counter()
+            proba = model.predict_proba(rows)
+            results.append((time.perf_counter() - start, proba))
+        (original_seconds, original_proba), (compiled_seconds, compiled_proba) = results
+        print(f"{DISPLAY_NAMES[stem]:<15} max difference {np.abs(original_proba - compiled_proba).max():.1e}, "
+              f"original {original_seconds * 1000:7.1f} ms, compiled {compiled_seconds * 1000:7.1f} ms")
@@ -2,9 +2,9 @@
 import streamlit as st
 import pyodbc
 import os
-import pandas as pd
-import time
 from Utils.more_info import markdown_table1, markdown_table2
+from Utils.data_loader import load_csv, load_dataset
+from Utils.preprocessing import values_mapper
 import streamlit_authenticator as stauth
 import yaml
 from yaml.loader import SafeLoader
@@ -60,36 +60,20 @@ else:
     st.title("Customer Churn Predictor Database")
 
     def show_dataframe():
-        # read csv
-        df = pd.read_csv("./Data/Customer_churn_Deployment_data.csv")
         # File uploader widget from local directory
         uploaded_file = st.file_uploader("Upload your data", type="csv")
+        # Progress bar follows the bytes read, a file loaded before comes straight from the cache
+        progress_bar = st.progress(0)
         if uploaded_file is not None:
-            df =pd.read_csv(uploaded_file)
+            df = load_csv(uploaded_file, on_progress=progress_bar.progress)
         else:
-            # load second training data
-            df = df.copy()
+            # typed deployment data, read from its parquet snapshot unless the csv changed
+            df = load_dataset(on_progress=progress_bar.progress)
+        progress_bar.progress(1.0)
         return df
     # load dataframe
     df = show_dataframe()
 
-    def values_mapper(df,columns):
-        """ This function takes two parameters and map the values in the column
-        df: dataframe object
-        columns_columns: columnsin in the dataframe that you want to map the values
-        returns dataframe
-        """
-        for col in columns:
-            cat_mapping = {True:"Yes",False:"No","No internet service":"No","No phone service":"No"}
-            df[col] = df[col].replace(cat_mapping)
-        return df
-
-    # Create a progress bar to let user know data is loading
-    progress_bar = st.progress(0)
-    for percentage_completed in range(100):
-        time.sleep(0.05)
-        progress_bar.progress(percentage_completed+1)
-
     st.success("Data loaded successfully!")
 
     # Initialize the session state for categories
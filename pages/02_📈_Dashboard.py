@@ -1,12 +1,13 @@
 
 import streamlit as st
 import plotly.express as px
-import pandas as pd
+import plotly.graph_objects as go
 import altair as alt
 from streamlit_option_menu import option_menu
 import streamlit_authenticator as stauth
 import yaml
 from yaml.loader import SafeLoader
+from Utils.dashboard_data import dataset_version, dashboard_aggregates, dashboard_chart_data, MAX_CHART_POINTS, SAMPLE_CAPACITY
 
 # Page configurations
 st.set_page_config(
@@ -62,8 +63,35 @@ else:
     # set page theme
     alt.themes.enable("dark")
     color_map = {"Yes":"blue","No":"skyblue"}
-    # read data for dashboard
-    df = pd.read_csv('./Data/Customer_churn_Deployment_data.csv')
+    # statistics behind the KPIs, histograms, box plots and correlation matrix, once per version of the file;
+    # only the rows appended since the previous version are read, the running totals are kept on disk
+    @st.cache_data(show_spinner="Computing dashboard statistics...")
+    def load_aggregates(version):
+        return dashboard_aggregates()
+
+    # bar totals and downsampled points, so charts never ship every raw row to the browser
+    @st.cache_data(show_spinner="Preparing charts...")
+    def load_chart_data(version, max_points):
+        return dashboard_chart_data(max_points=max_points)
+
+    data_version = dataset_version()
+    aggregates = load_aggregates(data_version)
+
+    def histogram_figure(column, title):
+        bins = aggregates["histograms"][column]
+        figure = px.bar(x=(bins["start"] + bins["end"]) / 2, y=bins["count"], title=title, labels={"x": column, "y": "count"})
+        figure.update_layout(bargap=0)
+        return figure
+
+    def box_figure(stats_by_name, title, colors=None):
+        figure = go.Figure()
+        for name, stats in stats_by_name.items():
+            figure.add_trace(go.Box(
+                y=[name], q1=[stats["q1"]], median=[stats["median"]], q3=[stats["q3"]],
+                lowerfence=[stats["lowerfence"]], upperfence=[stats["upperfence"]], mean=[stats["mean"]],
+                name=name, orientation="h", marker_color=(colors or {}).get(name)))
+        figure.update_layout(title=title)
+        return figure
 
     # Create a function to view the EDA
     def eda_dashboard():
@@ -73,36 +101,39 @@ else:
             #icons=['single','gear' 'cloud-upload'], 
             menu_icon="cast", default_index=0, orientation="horizontal")
         selected
+        chart_data = load_chart_data(data_version, st.session_state["max_chart_points"])
+        bars, points = chart_data["bars"], chart_data["points"]
         #st.markdown("#### Univariate Analysis")
 
         if selected == "Univariate Analysis":
         # manually set color map
             col1,col2 = st.columns(2)
             with col1:
-                monthlycharges_histogram = px.histogram(df,x="monthlycharges",title="Distribution of MonthlyCharges")
+                monthlycharges_histogram = histogram_figure("monthlycharges",title="Distribution of MonthlyCharges")
                 st.plotly_chart(monthlycharges_histogram)
             with col2:
-                totalcharges_histgram = px.histogram(df,x="totalcharges",title="Distribution of TotalCharges")
+                totalcharges_histgram = histogram_figure("totalcharges",title="Distribution of TotalCharges")
                 st.plotly_chart(totalcharges_histgram)
 
             col3,col4 = st.columns(2)
             with col3:
                 # plot a histogram of Tenure
-                tenure_histogram = px.histogram(df,x="tenure",title="Distribution of Tenure")
+                tenure_histogram = histogram_figure("tenure",title="Distribution of Tenure")
                 st.plotly_chart(tenure_histogram)
             with col4:
-                pieplot = px.pie(df,names="churn",title="Churn by InternetService",color="churn",color_discrete_map=color_map,hole=0.3)
+                churn_counts = aggregates["churn_counts"]
+                pieplot = px.pie(names=churn_counts.index,values=churn_counts.values,title="Churn by InternetService",color=churn_counts.index,color_discrete_map=color_map,hole=0.3)
                 st.plotly_chart(pieplot)
                 
             col5,col6 = st.columns(2)
             with col5:
-                boxplot = px.box(df,x="totalcharges",title="BoxPlot of TotalCharges")
+                boxplot = box_figure({"totalcharges": aggregates["box"]["totalcharges"]},title="BoxPlot of TotalCharges")
                 st.plotly_chart(boxplot)
             with col6:
-                boxplot = px.box(df,x="tenure",title="BoxPlot of Tenure")
+                boxplot = box_figure({"tenure": aggregates["box"]["tenure"]},title="BoxPlot of Tenure")
                 st.plotly_chart(boxplot)
 
-            boxplot = px.box(df,x="monthlycharges",title="Boxplot of MonthlyCharges")
+            boxplot = box_figure({"monthlycharges": aggregates["box"]["monthlycharges"]},title="Boxplot of MonthlyCharges")
             st.plotly_chart(boxplot)
 
         if selected == "Bivariate Analysis":
@@ -110,18 +141,18 @@ else:
             # st.markdown("#### Bivariate Analysis")
             col1,col2 = st.columns(2)
             with col1:
-                boxplot = px.box(df,x="monthlycharges",y="churn",color="churn",color_discrete_map=color_map,title="Distribution of Churn by MonthlyCharges")
+                boxplot = box_figure(aggregates["box_by_churn"]["monthlycharges"],title="Distribution of Churn by MonthlyCharges",colors=color_map)
                 st.plotly_chart(boxplot)
             with col2:
-                boxplot = px.box(df,x="totalcharges",y="churn",color="churn",color_discrete_map=color_map,title="Distribution of Churn by TotalCharges")
+                boxplot = box_figure(aggregates["box_by_churn"]["totalcharges"],title="Distribution of Churn by TotalCharges",colors=color_map)
                 st.plotly_chart(boxplot)
 
             col3,col4 = st.columns(2)
             with col3:
-                boxplot = px.box(df,x="tenure",y="churn",color="churn",color_discrete_map=color_map,title="Distribution of Churn by Tenure")
+                boxplot = box_figure(aggregates["box_by_churn"]["tenure"],title="Distribution of Churn by Tenure",colors=color_map)
                 st.plotly_chart(boxplot)
             with col4:
-                barplot = px.bar(df,x="internetservice",y="monthlycharges",color="churn",color_discrete_map=color_map)
+                barplot = px.bar(bars[("internetservice", "monthlycharges")],x="internetservice",y="monthlycharges",color="churn",color_discrete_map=color_map)
                 st.plotly_chart(barplot)
                 
         if selected == "Multivariate Analysis":
@@ -129,12 +160,10 @@ else:
             # st.markdown("#### Multivariate Analysis")
             col1,col2 = st.columns(2)
             with col1:
-                scatter_plot = px.scatter(df,x="monthlycharges",y="totalcharges",color="churn",color_discrete_map=color_map,title="Relation Between Churn and Charges")
+                scatter_plot = px.scatter(points,x="monthlycharges",y="totalcharges",color="churn",color_discrete_map=color_map,title="Relation Between Churn and Charges")
                 st.plotly_chart(scatter_plot)
             with col2:
-                numerical_data = df.select_dtypes("number")
-                #numerical_data.drop(columns=["Unnamed: 0"],inplace=True)
-                cor_matrix = numerical_data.corr()
+                cor_matrix = aggregates["correlation"]
                 heat_map = px.imshow(cor_matrix,text_auto=True,aspect="auto",title="Correlation Matrix")
                 st.plotly_chart(heat_map)
             
@@ -144,22 +173,25 @@ else:
         
     # KPIs Section
         met1, met2, met3, met4 = st.columns(4)
+        chart_data = load_chart_data(data_version, st.session_state["max_chart_points"])
+        bars, points = chart_data["bars"], chart_data["points"]
 
-    # Compute key metrics from the DataFrame
-        avg_tenure = df['tenure'].mean()
-        avg_monthly_charges = df['monthlycharges'].mean()
-        churn_rate = df['churn'].value_counts(normalize=True).get('Yes', 0) * 100
-        contract_count = df['contract'].value_counts()
+    # Key metrics precomputed once per dataset version
+        kpis = aggregates["kpis"]
+        avg_tenure = kpis['avg_tenure']
+        avg_monthly_charges = kpis['avg_monthly_charges']
+        churn_rate = kpis['churn_rate']
+        total_customers = kpis['total_customers']
 
     # Display KPIs
         met1.metric("Average Tenure", f"{avg_tenure:.2f} months", delta=-24)
         met2.metric("Average Monthly Charges", f"${avg_monthly_charges:.2f}", delta=18.0)
         met3.metric("Churn Rate",f"{churn_rate:.2f}%", delta=-11.0)
-        met4.metric("Total Customers", len(df), delta=len(df) - 1000)
+        met4.metric("Total Customers", total_customers, delta=total_customers - 1000)
 
         col1, col2, col3 = st.columns(3)
         with col1: 
-            violin_plot = px.bar(df, x="gender", y="seniorcitizen",
+            violin_plot = px.bar(bars[("gender", "seniorcitizen")],x="gender",y="seniorcitizen",
                             title="Impact of Monthly Charges On Customer Churn",
                             color="churn", color_discrete_map=color_map)
 
@@ -167,32 +199,32 @@ else:
             st.plotly_chart(violin_plot)
 
         with col2:
-            violin_plot = px.violin(df,x="churn",y="monthlycharges",title="Impact of Monthly Charges On Customer Churn",color="churn",color_discrete_map=color_map)
+            violin_plot = px.violin(points,x="churn",y="monthlycharges",title="Impact of Monthly Charges On Customer Churn",color="churn",color_discrete_map=color_map)
             st.plotly_chart(violin_plot)
         with col3:
-            churn_by_mu_multipleLiservice = px.bar(df,x="multiplelines",y="monthlycharges",color="churn",color_discrete_map=color_map,title="Churn by Multiple Services and Monthly Charges")
+            churn_by_mu_multipleLiservice = px.bar(bars[("multiplelines", "monthlycharges")],x="multiplelines",y="monthlycharges",color="churn",color_discrete_map=color_map,title="Churn by Multiple Services and Monthly Charges")
             st.plotly_chart(churn_by_mu_multipleLiservice)
 
         col4,col5,col6 = st.columns(3)
         with col4:
-            churn_by_contract= px.bar(df,x="contract",y="monthlycharges",color="churn",color_discrete_map=color_map,title="Churn by Contract Type and Monthly Charges")
+            churn_by_contract= px.bar(bars[("contract", "monthlycharges")],x="contract",y="monthlycharges",color="churn",color_discrete_map=color_map,title="Churn by Contract Type and Monthly Charges")
             st.plotly_chart(churn_by_contract)
         with col5:
-            churn_by_streaming_tv = px.bar(df,x="streamingtv",y="monthlycharges",color="churn",color_discrete_map=color_map,title="Churn by Streaming TV and Monthly Charges")
+            churn_by_streaming_tv = px.bar(bars[("streamingtv", "monthlycharges")],x="streamingtv",y="monthlycharges",color="churn",color_discrete_map=color_map,title="Churn by Streaming TV and Monthly Charges")
             st.plotly_chart(churn_by_streaming_tv)
         with col6:
-            churn_by_techsupport = px.bar(df,x="techsupport",y="monthlycharges",color="churn",color_discrete_map=color_map,title="Churn by Tech Support and Monthly Charges")
+            churn_by_techsupport = px.bar(bars[("techsupport", "monthlycharges")],x="techsupport",y="monthlycharges",color="churn",color_discrete_map=color_map,title="Churn by Tech Support and Monthly Charges")
             st.plotly_chart(churn_by_techsupport)
 
         col7,col8,col9 = st.columns(3)
         with col7:
-            monthly_charges_and_tenure = px.scatter(df,x="tenure",y="monthlycharges",color="churn",color_discrete_map=color_map,title="Relationship Between Monthly Charges and Tenure")
+            monthly_charges_and_tenure = px.scatter(points,x="tenure",y="monthlycharges",color="churn",color_discrete_map=color_map,title="Relationship Between Monthly Charges and Tenure")
             st.plotly_chart(monthly_charges_and_tenure)
         with col8:
-            total_charges_and_tenure = px.scatter(df,x="tenure",y="totalcharges",color="churn",color_discrete_map=color_map,title="Relationship Between Total Charges and Tenure")
+            total_charges_and_tenure = px.scatter(points,x="tenure",y="totalcharges",color="churn",color_discrete_map=color_map,title="Relationship Between Total Charges and Tenure")
             st.plotly_chart(total_charges_and_tenure)
         with col9:
-            tenure_versus_charges = px.density_contour(df,x="tenure",color="churn",color_discrete_map=color_map,marginal_x="histogram",marginal_y="histogram",title="Tenure by Churn Status")
+            tenure_versus_charges = px.density_contour(points,x="tenure",color="churn",color_discrete_map=color_map,marginal_x="histogram",marginal_y="histogram",title="Tenure by Churn Status")
             st.plotly_chart(tenure_versus_charges)
 
     # Sidebar
@@ -207,7 +239,7 @@ else:
         with col1:
             st.selectbox("Select Dashboard Type",options=["EDA","KPI"],key="selected_dashboard_type")
         with col2:
-            pass
+            st.number_input("Max points per chart",min_value=100,max_value=SAMPLE_CAPACITY,value=MAX_CHART_POINTS,step=100,key="max_chart_points")
         
         if st.session_state.selected_dashboard_type == "EDA":
             eda_dashboard()
@@ -1,10 +1,12 @@
-import os
 import datetime
 import streamlit as st
-import pandas as pd
-import joblib
 import yaml
 from yaml.loader import SafeLoader
+from Utils.model_registry import available_models, load_encoder, warm_up, start_watcher
+from Utils.inference import get_predictor
+from Utils.history_store import get_history_writer
+from Utils.prediction_cache import prediction_cache
+from Utils.ensemble import ENSEMBLE_NAME, ensemble_record, decode
 import streamlit_authenticator as stauth
 
 st.set_page_config(
@@ -13,6 +15,13 @@ st.set_page_config(
     layout='wide'
 )
 
+# start loading the frequently used models in the background, also when this page is opened
+# directly without going through Home, so the first prediction does not pay the load cost
+warm_up(lazy=True, background=True)
+
+# retrained models copied into Models/new are swapped in without restarting the app
+start_watcher()
+
 #### User Authentication
 # load the config.yaml file 
 with open('./Utils/config.yaml') as file:
@@ -56,35 +65,23 @@ else:
 
     st.title("Predict")
 
-    # Load models and encoder
-    @st.cache_resource
-    def load_logistic_reg_pipeline():
-        pipeline = joblib.load('Models/new/Logistic_reg.joblib')
-        return pipeline
-
-    @st.cache_resource
-    def load_adaboost_pipeline():
-        pipeline = joblib.load('Models/new/AdaBoost.joblib')
-        return pipeline
-
+    # Select model and encoder
     def select_model():
         col1, col2 = st.columns(2)
         with col1:
-            st.selectbox('Select a model', options=['Logistic Regression', 'AdaBoost'], key='selected_model')
+            st.selectbox('Select a model', options=available_models(), key='selected_model')
         with col2:
-            pass
+            # score the input with every shipped model at once and combine them with a soft vote
+            st.toggle('Compare all models', key='ensemble')
+            st.toggle('Run models concurrently', key='concurrent', disabled=not st.session_state.get('ensemble'))
 
-        if st.session_state['selected_model'] == 'Logistic Regression':
-            pipeline = load_logistic_reg_pipeline()
-        else:
-            pipeline = load_adaboost_pipeline()
+        # single-row predictor built on the model and encoder shared through the model registry
+        predictor = get_predictor(st.session_state['selected_model'])
 
-        encoder = joblib.load('Models/encoder.joblib')
-
-        return pipeline, encoder
+        return predictor
 
     # write a function to make prediction
-    def make_prediction(pipeline,encoder):
+    def make_prediction(predictor):
         gender = st.session_state["gender"]
         senior_citizen = st.session_state["senior_citizen"]
         partner = st.session_state["partner"]
@@ -105,48 +102,47 @@ else:
         tech_support = st.session_state["tech_support"]
         internet_service = st.session_state["internet_service"]
         
-        # create rows for the dataframe
-        data=[[gender,senior_citizen,partner,tenure,monthly_charges,total_charges,
-            payment_method,contract,paperless_billing,dependents,
-            phone_service,multiple_lines,streaming_tv,streaming_movies,
-            online_security,online_backup,device_protection,tech_support,
-            internet_service]]
-        # create columns for the dataframe
-        columns = ['gender','seniorcitizen','partner','tenure','monthlycharges', 'totalcharges'
-                ,'paymentmethod', 'contract','paperlessbilling','dependents','phoneservice', 
-                'multiplelines','streamingtv','streamingmovies','onlinesecurity', 
-                'onlinebackup', 'deviceprotection', 'techsupport','internetservice']
-        df = pd.DataFrame(data=data,columns=columns)
-
-        # Save dataframe to CSV as historics data
-        df.to_csv('./Data/history.csv')
-
-        # make predictions
-        pred = pipeline.predict(df)
-        pred_int = int(pred[0])
-
-        # transform the predicted variable 
-        prediction = encoder.inverse_transform([[pred_int]])[0]
-
-        # calculate prediction probability
-        probability = pipeline.predict_proba(df)[0][pred_int]
-
-        # Map probability to Yes or No
-        prediction_label = "Yes" if pred_int == 1 else "No"
-        
+        # create the record of input features
+        record = {'gender':gender,'seniorcitizen':senior_citizen,'partner':partner,'tenure':tenure,
+                'monthlycharges':monthly_charges,'totalcharges':total_charges,'paymentmethod':payment_method,
+                'contract':contract,'paperlessbilling':paperless_billing,'dependents':dependents,
+                'phoneservice':phone_service,'multiplelines':multiple_lines,'streamingtv':streaming_tv,
+                'streamingmovies':streaming_movies,'onlinesecurity':online_security,'onlinebackup':online_backup,
+                'deviceprotection':device_protection,'techsupport':tech_support,'internetservice':internet_service}
+
+        if st.session_state["ensemble"]:
+            # every model scores the record, the features are transformed once for all of them
+            per_model, vote = ensemble_record(record, concurrent=st.session_state["concurrent"])
+            encoder = load_encoder()
+            labels, probabilities = decode(vote, encoder)
+            prediction, probability = labels[0], float(probabilities[0])
+            model_used = ENSEMBLE_NAME
+            model_results = []
+            for name, proba in per_model.items():
+                model_labels, model_probabilities = decode(proba, encoder)
+                model_results.append({"Model": name, "Prediction": model_labels[0], "Probability": float(model_probabilities[0])})
+            st.session_state["model_results"] = model_results
+        else:
+            # make prediction, the label and its probability come from a single model run
+            prediction, probability = predictor.predict(record)
+            model_used = st.session_state["selected_model"]
+            st.session_state["model_results"] = None
+
+        # Map prediction to Yes or No
+        prediction_label = "Yes" if prediction == "Yes" else "No"
 
         # update the session state with the prediction and probability
         st.session_state["prediction"] = prediction
         st.session_state["prediction_label"] = prediction_label
         st.session_state["probability"] = probability
         
-        # update the dataframe to capture predictions for the history page
-        df["PredictionTime"] = datetime.date.today()
-        df["ModelUsed"] = st.session_state["selected_model"]
-        df["Prediction"] = st.session_state["prediction"]
-        df["PredictionProbability"] = st.session_state["probability"]
-        # export df as prediction_history.csv
-        df.to_csv('./Data/prediction_history.csv',mode="a", header=not os.path.exists('./Data/prediction_history.csv'),index=False)
+        # update the record to capture predictions for the history page
+        record["PredictionTime"] = datetime.datetime.now()
+        record["ModelUsed"] = model_used
+        record["Prediction"] = st.session_state["prediction"]
+        record["PredictionProbability"] = st.session_state["probability"]
+        # queue the prediction for the history database, it is written in the background
+        get_history_writer().submit(record)
         return prediction,prediction_label,probability
 
     # create an initial instance of session state to hold prediction
@@ -159,7 +155,7 @@ else:
     # Creating a form
     def display_forms():
         
-        pipeline, encoder = select_model()
+        predictor = select_model()
         with st.form('input-features'):
             col1,col2 = st.columns(2)
             with col1:
@@ -188,7 +184,7 @@ else:
                 st.selectbox("Are you a subscriber to the streaming TV service?",options=["Yes","No"],key="streaming_tv")
                 st.selectbox("Are you a subscriber to the streaming movies service?",options=["Yes","No"],key="streaming_movies")
                 st.selectbox("Are you a subscriber to the Paperless Billing Service?",options=["Yes","No"],key="paperless_billing")
-            st.form_submit_button("Make Prediction",on_click=make_prediction,kwargs=dict(pipeline=pipeline,encoder=encoder))
+            st.form_submit_button("Make Prediction",on_click=make_prediction,kwargs=dict(predictor=predictor))
         
 
     if __name__ == "__main__":
@@ -210,3 +206,9 @@ else:
                 st.write("### 🎯Prediction Probability")
                 probability = st.session_state['probability']*100
                 st.write(f"{probability:.2f}%")
+            if st.session_state.get("model_results"):
+                st.write("### 🧮 Prediction of every model")
+                st.dataframe(st.session_state["model_results"], hide_index=True)
+            # repeated inputs are answered from the prediction cache shared by every session
+            stats = prediction_cache.stats()
+            st.caption(f"Prediction cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
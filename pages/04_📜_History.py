@@ -119,10 +119,11 @@
 
 import streamlit as st
 import pandas as pd
-import os
+import math
 import streamlit_authenticator as stauth
 import yaml
 from yaml.loader import SafeLoader
+from Utils.history_store import HISTORY_COLUMNS, history_version, history_summary, count_history, query_history
 
 
 # Set page configuration
@@ -188,14 +189,59 @@ else:
 
     st.title("History")
 
-    def display_history_prediction():
+    # aggregates only change when a prediction is saved, so they are cached on the newest row id
+    @st.cache_data(show_spinner=False)
+    def load_history_summary(version):
+        return history_summary()
+
+    @st.cache_data(show_spinner=False)
+    def load_history_count(version, start, end, models):
+        return count_history(start=start, end=end, models=list(models))
 
-            csv_path = "./Data/history.csv"
-            csv_exists = os.path.exists(csv_path)
+    def display_history_prediction():
 
-            if csv_exists:
-                history = pd.read_csv(csv_path)
-                st.dataframe(history)
+            version = history_version()
+            summary = load_history_summary(version)
+            if summary.empty:
+                st.write("No history data found")
+                st.write("Please make a prediction to view the history page")
+                return
+
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                first_date = pd.to_datetime(summary["FirstPrediction"]).min().date()
+                last_date = pd.to_datetime(summary["LastPrediction"]).max().date()
+                date_range = st.date_input("Prediction date", value=(first_date, last_date), key="history_dates")
+            with col2:
+                models = st.multiselect("Model used", options=summary["ModelUsed"].tolist(), key="history_models")
+            with col3:
+                sort_by = st.selectbox("Sort by", options=HISTORY_COLUMNS, index=HISTORY_COLUMNS.index("PredictionTime"), key="history_sort")
+            with col4:
+                page_size = st.selectbox("Rows per page", options=[25, 50, 100, 500], index=1, key="history_page_size")
+            descending = st.toggle("Descending order", value=True, key="history_descending")
+
+            # the date input holds a single date while the user is still picking the range
+            start = date_range[0] if len(date_range) > 0 else None
+            end = date_range[1] if len(date_range) > 1 else start
+
+            # only the number of matching rows and the page being viewed are read from the database
+            total = load_history_count(version, start, end, tuple(models))
+            page_count = max(1, math.ceil(total / page_size))
+            if st.session_state.get("history_page", 1) > page_count:
+                st.session_state["history_page"] = 1
+            page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, step=1, key="history_page")
+
+            history = query_history(page=page, page_size=page_size, start=start, end=end, models=models,
+                                    sort_by=sort_by, descending=descending)
+            if history.empty:
+                st.write("No predictions match the selected filters")
+            else:
+                first_row = (page - 1) * page_size
+                st.caption(f"Showing rows {first_row + 1}-{first_row + len(history)} of {total}")
+                st.dataframe(history, use_container_width=True, hide_index=True)
+
+            with st.expander("Predictions per model"):
+                st.dataframe(summary, use_container_width=True, hide_index=True)
 
 
     if __name__ == '__main__':
@@ -1,11 +1,15 @@
 import os
+import hashlib
 import streamlit as st
 import pandas as pd
-import joblib
-import datetime
 import streamlit_authenticator as stauth
 import yaml
 from yaml.loader import SafeLoader
+from Utils.model_registry import available_models, load_model, load_encoder, warm_up, start_watcher
+from Utils.scoring import score_parallel, read_csv_chunks, write_scored_csv, PREVIEW_ROWS
+from Utils.scoring import new_scored_file, touch_scored_file, remove_scored_file, remove_stale_scored_files
+from Utils.preprocessing import SchemaError, RejectedRows, resolve_columns, prepare_and_validate
+from Utils.ensemble import score_ensemble_in_chunks
 
 st.set_page_config(
     page_title ='Bulk Predict Page',
@@ -13,6 +17,13 @@ st.set_page_config(
     layout="wide"
 )
 
+# start loading the frequently used models in the background, also when this page is opened
+# directly without going through Home, so the first prediction does not pay the load cost
+warm_up(lazy=True, background=True)
+
+# retrained models copied into Models/new are swapped in without restarting the app
+start_watcher()
+
 #### User Authentication
 # load the config.yaml file 
 with open('./Utils/config.yaml') as file:
@@ -56,98 +67,110 @@ else:
 
     st.title("Bulk Prediction")
 
-    # load the machine learning model components
-    @st.cache_resource
-    def load_logistic_reg_pipeline():
-        pipeline = joblib.load('Models/new/Logistic_reg.joblib')
-        return pipeline
-
-    @st.cache_resource
-    def load_adaboost_pipeline():
-        pipeline = joblib.load('Models/new/AdaBoost.joblib')
-        return pipeline
-
+    # select the machine learning model components
     def select_model():
         col1, col2 = st.columns(2)
         with col1:
-            st.selectbox('Select a model', options=['Logistic Regression', 'AdaBoost'], key='selected_model')
+            st.selectbox('Select a model', options=available_models(), key='selected_model')
         with col2:
-            pass
-
-        if st.session_state['selected_model'] == 'Logistic Regression':
-            pipeline = load_logistic_reg_pipeline()
-        else:
-            pipeline = load_adaboost_pipeline()
+            # large uploads are split across this many worker processes
+            st.number_input('Worker processes', min_value=1, max_value=os.cpu_count() or 1, value=1, step=1, key='workers')
+            # score the upload with every shipped model at once and add their soft vote
+            st.toggle('Compare all models', key='ensemble')
+            st.toggle('Run models concurrently', key='concurrent', disabled=not st.session_state.get('ensemble'))
 
-        encoder = joblib.load('Models/encoder.joblib')
+        # models and encoder are shared across pages through the model registry
+        pipeline = load_model(st.session_state['selected_model'])
+        encoder = load_encoder()
 
         return pipeline, encoder
 
-    def values_mapper(df,columns):
-        """ This function takes two parameters and map the values in the column
-        df: dataframe object
-        columns_columns: columnsin in the dataframe that you want to map the values
-        returns dataframe
-        """
-        for col in columns:
-            cat_mapping = {True:"Yes",False:"No","No internet service":"No","No phone service":"No"}
-            df[col] = df[col].replace(cat_mapping)
-        return df
-
-    columns_to_map = ["PaperlessBilling","Partner","Dependents","PhoneService","StreamingMovies","StreamingTV","MultipleLines","OnlineSecurity","OnlineBackup","DeviceProtection","TechSupport"]
-
-    def make_bulk_prediction(pipeline,encoder,data):
-        # make prediction
-        df = pd.DataFrame(data)
-        pred = pipeline.predict(df)
-        # decode label to original label in the dataset
-        decoded_prediction = encoder.inverse_transform(pred.reshape(-1,1))
-        # calculate prediction probability 
-        probabbility = pipeline.predict_proba(df)
-        # probability_label
-        prediction_label = ["Yes" if p == 1 else "No" for p in pred]
-        # create a dataframe to store the prediction and probability
-        df["PredictionTime"] = datetime.date.today()
-        df["Prediction"] = prediction_label
-        df["PredictionProbability"] = [probabbility[i][p] for i,p in enumerate(pred)]
-
-        return df
+    def prepare_data(data,rejected):
+        # match the column names to the model features and prepare them,
+        # rows with unusable values are set aside instead of failing the whole upload
+        valid, invalid = prepare_and_validate(data)
+        rejected.add(invalid)
+        return valid
+
+    def make_bulk_prediction(model_name,chunks,path):
+        if st.session_state["ensemble"]:
+            # every model scores each chunk, the features of a chunk are transformed once for all of them
+            scored_chunks = score_ensemble_in_chunks(chunks, concurrent=st.session_state["concurrent"])
+        else:
+            # score the data chunk by chunk, large uploads are shared out to worker processes
+            scored_chunks = score_parallel(model_name, chunks, workers=st.session_state["workers"])
+        # stream the scored rows to a file on disk, only a preview stays in memory
+        return write_scored_csv(scored_chunks, path=path)
+
+    def score_upload(uploaded_data, run_key):
+        # read the upload in chunks and prepare each chunk as it arrives
+        rejected = RejectedRows(keep=PREVIEW_ROWS)
+        chunks = (prepare_data(chunk,rejected) for chunk in read_csv_chunks(uploaded_data))
+
+        path = new_scored_file()
+        try:
+            pred_file, preview_df, row_count = make_bulk_prediction(st.session_state["selected_model"], chunks, path)
+            pred_file.close()
+        except BaseException:
+            remove_scored_file(path)
+            raise
+        return {"key": run_key, "path": path, "preview": preview_df, "row_count": row_count,
+                "rejected_count": rejected.count, "rejected_rows": rejected.rows}
 
 
     if __name__ == "__main__":
-        # call the get_selected_model function
-    # pipeline,encoder = get_selected_model()
+        # scored files of sessions that ended, or of an earlier run of the server, are cleaned up
+        remove_stale_scored_files()
+
+        # call the select_model function
+        pipeline,encoder = select_model()
         
         # accept data from user
         uploaded_data = st.file_uploader("Upload your CSV data here for prediction",type="csv")
 
         if uploaded_data is not None:
-            data = pd.read_csv(uploaded_data)
-
-            # drop the churn column
-            if "Churn" in data.columns:
-                data = data.drop(columns="Churn",axis=1)
-            # map the values in the columns
-            data = values_mapper(data,columns=columns_to_map)
-            # convert TotalCharges to numeric datatype
-            data["TotalCharges"] = pd.to_numeric(data["TotalCharges"],errors="coerce")
-            # map the senior citizen column into Yes or No
-            data["SeniorCitizen"] = data["SeniorCitizen"].map({0:"No",1:"Yes"})
-            
-            # call the make predictions
-            prediction_df = make_bulk_prediction('pipeline', 'encoder', data)
+            # check the header before reading any rows, so a mismatched file fails straight away
+            try:
+                resolve_columns(pd.read_csv(uploaded_data, nrows=0).columns)
+            except SchemaError as error:
+                st.error(f"The uploaded file does not match the model features. {error}")
+                st.stop()
+            uploaded_data.seek(0)
+
+            # the scored file is kept for the session, so reruns caused by other widgets
+            # reuse it instead of scoring the whole upload again
+            run_key = (hashlib.md5(uploaded_data.getvalue()).hexdigest(), st.session_state["selected_model"], st.session_state["ensemble"])
+            result = st.session_state.get("bulk_result")
+            # a file left unused for too long may have been cleaned up, the upload is then scored again
+            if result is None or result["key"] != run_key or not touch_scored_file(result["path"]):
+                if result is not None:
+                    remove_scored_file(result["path"])
+                st.session_state.pop("bulk_result", None)
+                result = st.session_state["bulk_result"] = score_upload(uploaded_data, run_key)
+
+            preview_df, row_count = result["preview"], result["row_count"]
             st.markdown("### 👇View Prediction Result")
-            st.write(prediction_df)
-
-            # convert data to csv
-            pred_csv = prediction_df.to_csv(index=False).encode("utf-8")
-
-            st.download_button(
-                "Download the Data",
-                data=pred_csv,
-                file_name="Prediction_Result.csv",
-                mime="text/csv")
+            st.write(f"Showing the first {len(preview_df)} of {row_count} predictions")
+            st.write(preview_df)
+
+            if result["rejected_count"]:
+                st.warning(f"{result['rejected_count']} rows were not scored because of invalid values")
+                st.write(result["rejected_rows"])
+
+            # the scored file is handed over as an open file, never read into a string here;
+            # streamlit still reads all of it into its media store on every rerun that shows the button,
+            # so the server holds a copy of the scored file in memory for every session showing a result
+            with open(result["path"], "rb") as pred_file:
+                st.download_button(
+                    "Download the Data",
+                    data=pred_file,
+                    file_name="Prediction_Result.csv",
+                    mime="text/csv")
         else:
+            # the upload was cleared, its scored file is not needed anymore
+            result = st.session_state.pop("bulk_result", None)
+            if result is not None:
+                remove_scored_file(result["path"])
             st.write("Please upload your data")
 
     
\ No newline at end of file
@@ -0,0 +1,129 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from Utils import dashboard_data
+from Utils.dashboard_data import CORRELATION_COLUMNS, NUMERIC_COLUMNS, compute_aggregates, refresh_aggregates
+from Utils.data_loader import DEPLOYMENT_DATA, apply_schema
+from Utils.quantile_sketch import RELATIVE_ACCURACY
+
+
+@pytest.fixture(scope="module")
+def customers():
+    return pd.read_csv(DEPLOYMENT_DATA, index_col=0)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "customers.csv"), str(tmp_path / "customers.dashboard.joblib")
+
+
+def refresh(paths):
+    with dashboard_data._lock:
+        return refresh_aggregates(*paths)
+
+
+def assert_matches_full_recompute(aggregates, path):
+    incremental = aggregates.aggregates()
+    full = compute_aggregates(apply_schema(pd.read_csv(path, index_col=0)))
+    assert incremental["kpis"]["total_customers"] == full["kpis"]["total_customers"]
+    for name in ("avg_tenure", "avg_monthly_charges", "churn_rate"):
+        assert incremental["kpis"][name] == pytest.approx(full["kpis"][name], rel=1e-12)
+    assert incremental["churn_counts"].to_dict() == full["churn_counts"].to_dict()
+    assert incremental["kpis"]["contract_counts"].to_dict() == full["kpis"]["contract_counts"].to_dict()
+    correlation = full["correlation"].loc[CORRELATION_COLUMNS, CORRELATION_COLUMNS]
+    assert np.allclose(incremental["correlation"], correlation, rtol=0, atol=1e-9)
+    for col in NUMERIC_COLUMNS:
+        assert incremental["box"][col]["count"] == full["box"][col]["count"]
+        for stat in ("q1", "median", "q3"):
+            assert incremental["box"][col][stat] == pytest.approx(full["box"][col][stat], rel=RELATIVE_ACCURACY, abs=1e-9)
+        assert incremental["histograms"][col]["count"].sum() == full["histograms"][col]["count"].sum()
+
+
+def test_append_matches_full_recompute(customers, paths):
+    path, state_path = paths
+    customers.iloc[:5000].to_csv(path)
+    refresh(paths)
+    customers.iloc[5000:].to_csv(path, mode="a", header=False)
+    aggregates = refresh(paths)
+    assert aggregates.rows == len(customers)
+    assert_matches_full_recompute(aggregates, path)
+
+
+def test_restart_carries_on_from_saved_state(customers, paths):
+    path, state_path = paths
+    customers.iloc[:5000].to_csv(path)
+    refresh(paths)
+    # a new server process only has the saved state
+    dashboard_data._aggregates.clear()
+    customers.iloc[5000:].to_csv(path, mode="a", header=False)
+    aggregates = refresh(paths)
+    assert aggregates.rows == len(customers)
+    assert_matches_full_recompute(aggregates, path)
+
+
+def test_same_size_edit_is_recounted(customers, paths):
+    path, state_path = paths
+    customers.to_csv(path)
+    before = refresh(paths)
+    with open(path, "rb") as handle:
+        data = bytearray(handle.read())
+    # change one digit of the monthly charges halfway through the file, the size stays the same
+    middle = data.index(b".", len(data) // 2) - 1
+    data[middle] = ord("1") if data[middle] != ord("1") else ord("2")
+    with open(path, "wb") as handle:
+        handle.write(data)
+    after = refresh(paths)
+    assert after is not before
+    assert_matches_full_recompute(after, path)
+
+
+def test_last_row_without_line_break(customers, paths):
+    path, state_path = paths
+    with open(path, "w") as handle:
+        handle.write(customers.iloc[:3000].to_csv().rstrip("\n"))
+    aggregates = refresh(paths)
+    assert aggregates.rows == 3000
+    assert_matches_full_recompute(aggregates, path)
+
+    # the file carries on with a new line
+    with open(path, "a") as handle:
+        handle.write("\n" + customers.iloc[3000:].to_csv(header=False))
+    assert refresh(paths) is aggregates
+    assert_matches_full_recompute(aggregates, path)
+
+
+def test_extended_last_row_is_recounted(customers, paths):
+    path, state_path = paths
+    # the last row stops after its total charges, without the churn label or a line break
+    text, churn = customers.iloc[:3000].to_csv().rstrip("\n").rsplit(",", 1)
+    with open(path, "w") as handle:
+        handle.write(text)
+    before = refresh(paths)
+    # the rest of that row is written, its total charges get one more digit
+    with open(path, "a") as handle:
+        handle.write(f"5,{churn}\n")
+    after = refresh(paths)
+    assert after is not before
+    assert_matches_full_recompute(after, path)
+
+
+def test_unchanged_csv_is_not_read_again(customers, paths):
+    path, state_path = paths
+    customers.iloc[:1000].to_csv(path)
+    aggregates = refresh(paths)
+    with open(path, "rb") as handle:
+        assert aggregates.update_from_csv(handle) == 0
+    assert os.path.exists(state_path)
+
+
+def test_appended_row_with_blank_numbers(customers, paths):
+    path, state_path = paths
+    customers.iloc[:1000].to_csv(path)
+    refresh(paths)
+    blank = customers.iloc[[1000]].assign(tenure=None, seniorcitizen=None)
+    blank.to_csv(path, mode="a", header=False)
+    aggregates = refresh(paths)
+    assert aggregates.rows == 1001
+    assert aggregates.sketches["tenure"].count == 1000
+    assert_matches_full_recompute(aggregates, path)
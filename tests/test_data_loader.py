@@ -0,0 +1,37 @@
+import threading
+import pandas as pd
+from Utils.data_loader import DEPLOYMENT_DATA, apply_schema, load_dataset
+
+
+def test_blank_numbers_are_missing_values(tmp_path):
+    path = tmp_path / "customers.csv"
+    customers = pd.read_csv(DEPLOYMENT_DATA, index_col=0).head(100)
+    customers.loc[customers.index[3], ["tenure", "seniorcitizen", "totalcharges"]] = None
+    customers.to_csv(path)
+    df = apply_schema(pd.read_csv(path, index_col=0))
+    assert df[["tenure", "seniorcitizen", "totalcharges"]].isna().sum().tolist() == [1, 1, 1]
+    assert df["tenure"].dropna().tolist() == customers["tenure"].dropna().astype(int).tolist()
+
+
+def test_concurrent_snapshot_rebuilds(tmp_path):
+    path, snapshot_path = tmp_path / "customers.csv", tmp_path / "customers.parquet"
+    pd.read_csv(DEPLOYMENT_DATA, index_col=0).head(2000).to_csv(path)
+    errors = []
+
+    def load(i):
+        try:
+            # a csv copied under a new name each time misses the in-memory cache and rebuilds the snapshot
+            copy = tmp_path / f"customers{i}.csv"
+            copy.write_bytes(path.read_bytes())
+            load_dataset(str(copy), snapshot_path=str(snapshot_path))
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=load, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert sorted(file.name for file in tmp_path.iterdir() if file.suffix == ".tmp") == []
+    assert len(pd.read_parquet(snapshot_path)) == 2000
@@ -0,0 +1,64 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from Utils.data_loader import load_rows
+from Utils.fused_logistic import PARITY_TOLERANCE, FusedLogisticPipeline, fuse_logistic_pipeline, parity_sample
+from Utils.inference import SingleRowPredictor
+from Utils.prediction_cache import PredictionCache
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    return joblib.load("Models/new/Logistic_reg.joblib")
+
+
+@pytest.fixture(scope="module")
+def fused(pipeline):
+    return fuse_logistic_pipeline(pipeline)
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return load_rows().sample(2000, random_state=0)
+
+
+def test_fused_matches_pipeline_on_deployment_rows(pipeline, fused, rows):
+    assert np.abs(fused.predict_proba(rows) - pipeline.predict_proba(rows)).max() <= PARITY_TOLERANCE
+    assert (fused.predict(rows) == pipeline.predict(rows)).all()
+
+
+def test_fused_matches_pipeline_with_missing_and_unknown_values(pipeline, fused):
+    sample = parity_sample(fused, random_state=1)
+    assert np.abs(fused.predict_proba(sample) - pipeline.predict_proba(sample)).max() <= PARITY_TOLERANCE
+
+
+def test_categorical_columns_score_like_object_columns(fused, rows):
+    categorical = rows.astype({col: "category" for col in fused.preprocessor.categorical_columns})
+    assert np.abs(fused.predict_proba(categorical) - fused.predict_proba(rows)).max() <= PARITY_TOLERANCE
+
+
+def test_record_matches_pipeline(pipeline, fused, rows):
+    for record in rows.head(50).to_dict("records"):
+        expected = pipeline.predict_proba(pd.DataFrame([record]))[0]
+        assert np.abs(fused.predict_proba_record(record) - expected).max() <= PARITY_TOLERANCE
+
+
+def test_record_with_missing_values(pipeline, fused, rows):
+    record = rows.iloc[0].to_dict()
+    record.update(tenure=None, contract=None, paymentmethod="unknown level")
+    expected = pipeline.predict_proba(pd.DataFrame([record]))[0]
+    assert np.abs(fused.predict_proba_record(record) - expected).max() <= PARITY_TOLERANCE
+
+
+def test_rejects_other_classifiers():
+    with pytest.raises(ValueError):
+        FusedLogisticPipeline(joblib.load("Models/new/Decision_tree.joblib"))
+
+
+def test_single_row_predictor_tells_none_from_nan(pipeline, fused, rows):
+    predictor = SingleRowPredictor(fused, joblib.load("Models/new/encoder.joblib"), cache=PredictionCache(max_size=10))
+    for value in [np.nan, None, np.nan]:
+        record = dict(rows.iloc[0].to_dict(), contract=value)
+        expected = pipeline.predict_proba(pd.DataFrame([record]))[0]
+        assert np.abs(predictor.predict_proba(record) - expected).max() <= PARITY_TOLERANCE
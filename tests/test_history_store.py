@@ -0,0 +1,46 @@
+import sqlite3
+from contextlib import closing
+import pandas as pd
+from Utils import history_store
+from Utils.history_store import FEATURE_COLUMNS, PREDICTION_COLUMNS, HISTORY_COLUMNS, connect, read_legacy_csv
+
+
+def legacy_csv(tmp_path, rows=4):
+    path = tmp_path / "legacy.csv"
+    history = pd.DataFrame({col: ["No"] * rows for col in FEATURE_COLUMNS})
+    history = history.assign(tenure=range(rows), PredictionTime=[f"2024-05-0{i + 1} 10:00:00" for i in range(rows)],
+                             ModelUsed="AdaBoost", Prediction="No", PredictionProbability=0.75)
+    history[HISTORY_COLUMNS].to_csv(path, index=False)
+    return str(path)
+
+
+def count(path):
+    with closing(connect(path)) as connection:
+        return connection.execute("SELECT COUNT(*) FROM prediction_history").fetchone()[0]
+
+
+def test_other_databases_do_not_import_the_default_legacy_csv(tmp_path):
+    assert count(str(tmp_path / "scratch.db")) == 0
+
+
+def test_legacy_csv_is_imported_once(tmp_path):
+    path = str(tmp_path / "history.db")
+    with closing(connect(path, legacy_csv=legacy_csv(tmp_path))):
+        pass
+    history_store._schema_ready.clear()
+    with closing(connect(path, legacy_csv=legacy_csv(tmp_path))):
+        pass
+    assert count(path) == 4
+
+
+def test_database_created_before_the_import_gets_the_missing_rows(tmp_path):
+    path, csv_path = str(tmp_path / "history.db"), legacy_csv(tmp_path)
+    # a table written by an earlier version, holding one of the legacy rows already
+    legacy, _ = read_legacy_csv(csv_path)
+    columns = ", ".join(f'"{name}" {sql_type}' for name, sql_type in {**FEATURE_COLUMNS, **PREDICTION_COLUMNS}.items())
+    with closing(sqlite3.connect(path)) as connection:
+        connection.execute(f"CREATE TABLE prediction_history (id INTEGER PRIMARY KEY, {columns})")
+        history_store._insert(connection, legacy.head(1).assign(PredictionTime=legacy["PredictionTime"].dt.strftime("%Y-%m-%d %H:%M:%S")))
+    with closing(connect(path, legacy_csv=csv_path)):
+        pass
+    assert count(path) == 4
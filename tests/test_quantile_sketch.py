@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from Utils.quantile_sketch import RELATIVE_ACCURACY, QuantileSketch
+
+QUANTILES = [0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1]
+
+rng = np.random.default_rng(0)
+DATASETS = {
+    "lognormal": rng.lognormal(3, 1.5, 100_000),
+    "signed with zeros": np.concatenate([rng.normal(0, 50, 50_000), np.zeros(1000)]),
+    "whole numbers": rng.integers(0, 73, 100_000).astype(float),
+    "charges": rng.uniform(18.25, 118.75, 100_000).round(2),
+}
+
+
+def sketch_of(values, chunks=7):
+    sketch = QuantileSketch()
+    for chunk in np.array_split(values, chunks):
+        sketch.update(chunk)
+    return sketch
+
+
+@pytest.mark.parametrize("name", DATASETS)
+def test_quantiles_within_relative_accuracy(name):
+    values = DATASETS[name]
+    estimates = np.array(sketch_of(values).quantiles(QUANTILES))
+    # the sketch returns a value of the data at rank q * (count - 1)
+    exact = np.quantile(values, QUANTILES, method="lower")
+    assert (np.abs(estimates - exact) <= RELATIVE_ACCURACY * np.abs(exact) + 1e-12).all()
+
+
+@pytest.mark.parametrize("name", DATASETS)
+def test_exact_summary(name):
+    values = DATASETS[name]
+    sketch = sketch_of(values)
+    assert sketch.count == len(values)
+    assert sketch.mean() == pytest.approx(values.mean())
+    assert (sketch.min, sketch.max) == (values.min(), values.max())
+    counts, edges = sketch.histogram(40)
+    assert counts.sum() == len(values) and (counts >= 0).all()
+    assert (edges[0], edges[-1]) == (values.min(), values.max())
+
+
+def test_histogram_of_whole_numbers_is_exact():
+    values = DATASETS["whole numbers"]
+    counts, edges = sketch_of(values).histogram(40)
+    assert (counts == np.histogram(values, bins=40)[0]).all()
+
+
+def test_missing_values_are_skipped():
+    sketch = QuantileSketch()
+    sketch.update([np.nan, 1.0, np.nan, 3.0])
+    assert sketch.count == 2 and sketch.quantiles([0.5])[0] == 1.0
+
+
+def test_empty_sketch():
+    sketch = QuantileSketch()
+    sketch.update([])
+    assert np.isnan(sketch.quantiles([0.5])[0]) and np.isnan(sketch.mean())
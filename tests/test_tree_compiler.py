@@ -0,0 +1,36 @@
+import joblib
+import numpy as np
+import pytest
+from Utils.data_loader import load_rows
+from Utils.tree_compiler import PARITY_TOLERANCE, CompiledTreeClassifier, compile_tree_pipeline, parity_sample
+
+SAMPLE_ROWS = 2000
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return load_rows().sample(SAMPLE_ROWS, random_state=0)
+
+
+@pytest.mark.parametrize("stem", ["AdaBoost", "Decision_tree", "XGBoost"])
+def test_compiled_pipeline_matches_original_on_deployment_rows(stem, rows):
+    pipeline = joblib.load(f"Models/new/{stem}.joblib")
+    compiled = compile_tree_pipeline(pipeline)
+    expected = pipeline.predict_proba(rows)
+    assert np.abs(compiled.predict_proba(rows) - expected).max() <= PARITY_TOLERANCE
+    assert (compiled.predict(rows) == pipeline.predict(rows)).all()
+
+
+@pytest.mark.parametrize("stem", ["AdaBoost", "Decision_tree", "XGBoost"])
+def test_compiled_classifier_matches_original_on_split_thresholds(stem):
+    classifier = joblib.load(f"Models/new/{stem}.joblib").steps[-1][1]
+    compiled = CompiledTreeClassifier(classifier)
+    # a quarter of these rows sit exactly on a split threshold
+    X = parity_sample(classifier, compiled.trees, random_state=1)
+    assert np.abs(compiled.predict_proba(X) - classifier.predict_proba(X)).max() <= PARITY_TOLERANCE
+
+
+def test_empty_batch():
+    classifier = joblib.load("Models/new/AdaBoost.joblib").steps[-1][1]
+    compiled = CompiledTreeClassifier(classifier)
+    assert compiled.predict_proba(np.empty((0, classifier.n_features_in_))).shape == (0, 2)
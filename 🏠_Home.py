@@ -7,11 +7,19 @@ import streamlit_authenticator as stauth
 import requests
 import json
 from streamlit_option_menu import option_menu
+from Utils.model_registry import warm_up, start_watcher
 
 
 # Set page configuration
 st.set_page_config(page_title="Home", page_icon="🏠",  layout="wide")
 
+# start loading the frequently used models in the background so the first prediction
+# does not pay the deserialization cost, the other models load when first selected
+warm_up(lazy=True, background=True)
+
+# retrained models copied into Models/new are swapped in without restarting the app
+start_watcher()
+
 with open('./Utils/config.yaml') as file:
     config = yaml.load(file, Loader=SafeLoader)
 
@@ -202,7 +210,7 @@ if st.session_state['authentication_status']:
                 '''
                 st.code(code,language="python")
             uploaded_file = st.file_uploader("Upload your file here")
-            st.markdown("*Kindly rename your columns to align with our naming conventions: Cheers 🥂*")
+            st.markdown("*Column names such as PaperlessBilling, paperless_billing or Paperless Billing are matched to our naming conventions automatically: Cheers 🥂*")
             
 
     